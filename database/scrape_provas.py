@@ -7,27 +7,62 @@ for every course in vagas.csv, extracts:
   - Fórmula de cálculo (peso_secundario, peso_exames)
   - Classificações mínimas (nota_minima)
 
+Pages are fetched concurrently (CONCURRENCY in flight) through
+scripts/dges_fetch.py, over a pool of keep-alive http.client connections
+so each worker reuses its TCP+TLS session instead of reconnecting per
+page. The request rate adapts to dges.gov.pt's latency and 429/5xx
+answers, starting at RATE and never above MAX_RATE requests/second;
+every request sent (redirect hops included) takes a token.
+
 Outputs:
-  database/data/provas_cache.json    ← resumes if interrupted
+  database/data/provas_cache.jsonl   ← append-only journal, resumes if interrupted
   database/data/provas_import.sql    ← paste into Supabase after courses_import.sql
 
+Failed pages are never cached: they go into data/provas_retry.json with
+exponential backoff + jitter (honouring Retry-After) and are retried by
+later runs once due, up to a max-attempts limit (--retry-failed forces
+all of them now). A 4xx other than 404 is recorded as permanent there
+(only --retry-failed tries it again); a 404 is cached as not found.
+
+The journal gets one line per scraped page; a sidecar index (key → byte
+offset) makes membership and lookups O(1) without loading every entry,
+and it is compacted when superseded lines pile up. An existing
+provas_cache.json is imported into the journal once.
+
 Usage:
     python3 database/scrape_provas.py
+    python3 database/scrape_provas.py --retry-failed
 """
 
-import csv, itertools, json, re, sys, time, urllib.request, urllib.error
+import csv, itertools, json, os, re, sys
 from html.parser import HTMLParser
 from pathlib import Path
 
 BASE       = Path(__file__).parent
+sys.path.insert(0, str(BASE.parent / "scripts"))
+from dges_fetch import (  # noqa: E402  (stdlib only)
+    AdaptiveRate, ConnectionPool, RetryQueue, TokenBucket, fetch_all, parse_retry_after,
+    transient,
+)
+
 VAGAS_FILE = BASE / "data" / "vagas.csv"
-CACHE_FILE = BASE / "data" / "provas_cache.json"
+CACHE_FILE = BASE / "data" / "provas_cache.json"    # legacy, imported once
+JOURNAL    = BASE / "data" / "provas_cache.jsonl"
+RETRY_FILE = BASE / "data" / "provas_retry.json"
 OUT_FILE   = BASE / "data" / "provas_import.sql"
 
 DGES_URL = "https://www.dges.gov.pt/guias/detcursopi.asp?codc={codc}&code={code}"
 DELAY    = 0.45   # seconds between requests — be polite to the server
+MAX_RATE = 1 / DELAY  # agreed ceiling in requests/second — never exceeded
+RATE     = 1.0    # starting requests/second; adapts between 0.2 and MAX_RATE
+CONCURRENCY = 6   # requests in flight
 TIMEOUT  = 12
 
+CONTROL = AdaptiveRate(start=RATE, ceiling=MAX_RATE)
+# Every request the pool sends (redirect hops, keep-alive retries) takes a
+# token and is observed by CONTROL
+POOL    = ConnectionPool(max_idle=CONCURRENCY, bucket=TokenBucket(CONTROL), control=CONTROL)
+
 # ─── HTML section extractor ────────────────────────────────────────────────
 class TextExtractor(HTMLParser):
     def __init__(self):
@@ -180,37 +215,173 @@ def parse_minima(text: str):
 
 
 # ─── HTTP fetch ────────────────────────────────────────────────────────────
-def fetch(codc: str, code: str) -> dict | None:
+def fetch(codc: str, code: str) -> dict:
+    """Scraped entry, a not_found entry, or {"error": ..., "retry_after": s|None}."""
     url = DGES_URL.format(codc=codc, code=code)
     try:
-        req = urllib.request.Request(url, headers={"User-Agent": "Mozilla/5.0"})
-        with urllib.request.urlopen(req, timeout=TIMEOUT) as resp:
-            html = resp.read().decode("iso-8859-1")
-
-        provas_text  = extract_section(html, "Provas de Ingresso")
-        formula_text = extract_section(html, r"F[oó]rmula de C[aá]lculo")
-        minima_text  = extract_section(html, r"Classifica[cç][oõ]es M[ií]nimas")
-
-        conjuntos            = parse_provas(provas_text)
-        peso_sec, peso_exam  = parse_formula(formula_text)
-        nota_min             = parse_minima(minima_text)
-
-        return {
-            "codc": codc,
-            "code": code,
-            "conjuntos": conjuntos,
-            "peso_secundario": peso_sec,
-            "peso_exames": peso_exam,
-            "nota_minima": nota_min,
-        }
-    except urllib.error.HTTPError as e:
-        if e.code == 404:
-            return {"codc": codc, "code": code, "not_found": True}
-        print(f"  HTTP {e.code} for {codc}/{code}")
-        return None
-    except Exception as e:
+        resp = POOL.get(url, headers={"User-Agent": "Mozilla/5.0"}, timeout=TIMEOUT)
+    except Exception as e:   # timeout, DNS, refused, reset, malformed response
         print(f"  Error {codc}/{code}: {e}")
-        return None
+        return {"codc": codc, "code": code, "error": str(e)[:200], "retry_after": None}
+
+    if resp.status == 404:
+        return {"codc": codc, "code": code, "not_found": True}
+    if resp.status >= 400:
+        print(f"  HTTP {resp.status} for {codc}/{code}")
+        return {"codc": codc, "code": code, "error": f"HTTP {resp.status}",
+                "retry_after": parse_retry_after(resp.headers.get("Retry-After")),
+                "permanent": not transient(resp.status)}
+
+    html = resp.body.decode("iso-8859-1")
+
+    provas_text  = extract_section(html, "Provas de Ingresso")
+    formula_text = extract_section(html, r"F[oó]rmula de C[aá]lculo")
+    minima_text  = extract_section(html, r"Classifica[cç][oõ]es M[ií]nimas")
+
+    conjuntos            = parse_provas(provas_text)
+    peso_sec, peso_exam  = parse_formula(formula_text)
+    nota_min             = parse_minima(minima_text)
+
+    return {
+        "codc": codc,
+        "code": code,
+        "conjuntos": conjuntos,
+        "peso_secundario": peso_sec,
+        "peso_exames": peso_exam,
+        "nota_minima": nota_min,
+    }
+
+
+# ─── Cache journal ─────────────────────────────────────────────────────────
+class CacheJournal:
+    """
+    Append-only JSONL cache: one {"key": ..., "entry": {...}} line per write.
+    The last line for a key wins. <journal>.idx holds key → byte offset plus
+    the journal size it covers, so opening only scans lines written since.
+    A torn last line (run killed mid-write) is truncated away on open.
+    """
+
+    def __init__(self, path: Path, legacy: Path | None = None):
+        self.path     = path
+        self.idx_path = path.with_name(path.name + ".idx")
+        self.offsets: dict[str, int] = {}
+        self.lines = 0
+
+        if not path.exists() and legacy is not None and legacy.exists():
+            self._import_legacy(legacy)
+        path.touch()
+        self._load_index()
+        self._fh = open(path, "ab")
+
+    # ── Open / index ──────────────────────────────────────────────────────
+    def _import_legacy(self, legacy: Path) -> None:
+        old = json.loads(legacy.read_text(encoding="utf-8"))
+        failed = 0
+        with open(self.path, "wb") as fh:
+            for key, entry in old.items():
+                if entry.get("error"):
+                    failed += 1   # old runs cached failures — leave them out so they are retried
+                    continue
+                fh.write(self._line(key, entry))
+        print(f"  Imported {len(old) - failed} entries from {legacy.name} ({failed} failed left out)")
+
+    def _load_index(self) -> None:
+        start = 0
+        if self.idx_path.exists():
+            try:
+                idx = json.loads(self.idx_path.read_text(encoding="utf-8"))
+                if idx["size"] <= self.path.stat().st_size:
+                    self.offsets, self.lines, start = idx["offsets"], idx["lines"], idx["size"]
+            except (ValueError, KeyError):
+                pass
+        with open(self.path, "rb") as fh:
+            fh.seek(start)
+            pos = start
+            for raw in fh:
+                if not raw.endswith(b"\n"):
+                    break
+                self.offsets[json.loads(raw)["key"]] = pos
+                self.lines += 1
+                pos += len(raw)
+        # A run killed mid-write leaves a torn last line: cut it off so the
+        # next put() starts on a fresh line instead of running on from it
+        if self.path.stat().st_size > pos:
+            os.truncate(self.path, pos)
+
+    def save_index(self) -> None:
+        self._fh.flush()
+        tmp = self.idx_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({
+            "size":    self.path.stat().st_size,
+            "lines":   self.lines,
+            "offsets": self.offsets,
+        }), encoding="utf-8")
+        os.replace(tmp, self.idx_path)
+
+    # ── Read / write ──────────────────────────────────────────────────────
+    @staticmethod
+    def _line(key: str, entry: dict) -> bytes:
+        return (json.dumps({"key": key, "entry": entry}, ensure_ascii=False) + "\n").encode("utf-8")
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def get(self, key: str) -> dict | None:
+        if key not in self.offsets:
+            return None
+        self._fh.flush()
+        with open(self.path, "rb") as fh:
+            fh.seek(self.offsets[key])
+            return json.loads(fh.readline())["entry"]
+
+    def put(self, key: str, entry: dict) -> None:
+        pos = self._fh.tell()
+        self._fh.write(self._line(key, entry))
+        self._fh.flush()
+        self.offsets[key] = pos
+        self.lines += 1
+
+    def items(self):
+        """(key, latest entry) pairs in journal order — one sequential read."""
+        self._fh.flush()
+        live = set(self.offsets.values())
+        with open(self.path, "rb") as fh:
+            pos = 0
+            for raw in fh:
+                if pos in live:
+                    rec = json.loads(raw)
+                    yield rec["key"], rec["entry"]
+                pos += len(raw)
+
+    def values(self):
+        return (entry for _key, entry in self.items())
+
+    # ── Compaction ────────────────────────────────────────────────────────
+    def compact(self, min_dead_ratio: float = 0.25) -> None:
+        """Rewrite the journal with live entries only, once enough lines are dead."""
+        dead = self.lines - len(self.offsets)
+        if not dead or dead < min_dead_ratio * self.lines:
+            return
+        tmp = self.path.with_suffix(".tmp")
+        offsets: dict[str, int] = {}
+        with open(tmp, "wb") as out:
+            for key, entry in self.items():
+                offsets[key] = out.tell()
+                out.write(self._line(key, entry))
+        self._fh.close()
+        os.replace(tmp, self.path)
+        self._fh = open(self.path, "ab")
+        self.offsets, self.lines = offsets, len(offsets)
+        self.save_index()
+        print(f"  Compacted journal: dropped {dead} superseded lines")
+
+    def close(self) -> None:
+        self.compact()
+        self.save_index()
+        self._fh.close()
 
 
 # ─── Load vagas: build course index ────────────────────────────────────────
@@ -248,7 +419,7 @@ def make_course_id(ies: str, code: str, codc: str) -> str:
 
 
 # ─── SQL generation ───────────────────────────────────────────────────────
-def generate_sql(cache: dict, uo_to_ies: dict[tuple[str, str], str]) -> str:
+def generate_sql(cache: CacheJournal, uo_to_ies: dict[tuple[str, str], str]) -> str:
     update_lines: list[str] = []
     req_rows: list[str]     = []
 
@@ -317,51 +488,65 @@ def main():
     courses, uo_to_ies = load_vagas()
     print(f"  {len(courses)} unique (COD CURSO, COD UO) pairs")
 
-    # Load existing cache
-    cache: dict[str, dict] = {}
-    if CACHE_FILE.exists():
-        cache = json.loads(CACHE_FILE.read_text(encoding="utf-8"))
+    # Open the cache journal (imports the legacy JSON cache on first run)
+    cache = CacheJournal(JOURNAL, legacy=CACHE_FILE)
+    if len(cache):
         print(f"  Cache: {len(cache)} entries already done")
 
+    retry = RetryQueue(RETRY_FILE, force="--retry-failed" in sys.argv)
     to_scrape = [(codc, code, ies) for codc, code, ies in courses
-                 if f"{codc}_{code}" not in cache]
+                 if f"{codc}_{code}" not in cache and retry.due(f"{codc}_{code}")]
+    due, waiting, exhausted = retry.counts()
+    if retry.items:
+        print(f"  Retry queue: {due} due, {waiting} waiting on backoff, {exhausted} given up")
 
-    print(f"  To scrape: {len(to_scrape)} (est. {len(to_scrape) * DELAY / 60:.1f} min)")
+    print(f"  To scrape: {len(to_scrape)} (est. {len(to_scrape) / RATE / 60:.1f} min)")
     if not to_scrape:
         print("  Nothing new to scrape — regenerating SQL from cache.")
 
-    scraped = errors = 0
-    for i, (codc, code, _ies) in enumerate(to_scrape):
+    jobs = {DGES_URL.format(codc=codc, code=code): (codc, code) for codc, code, _ies in to_scrape}
+    done = scraped = errors = 0
+
+    def on_result(url: str, result) -> None:
+        nonlocal done, scraped, errors
+        codc, code = jobs[url]
         key = f"{codc}_{code}"
-        result = fetch(codc, code)
+        done += 1
 
-        if result:
-            cache[key] = result
+        if isinstance(result, Exception):
+            result = {"error": str(result)[:200], "retry_after": None}
+        if result.get("error"):
+            retry.fail(key, result["error"], result["retry_after"], result.get("permanent", False))
+            errors += 1
+        else:
+            cache.put(key, result)
+            retry.done(key)
             if result.get("not_found"):
                 pass  # silent
             else:
                 scraped += 1
-        else:
-            cache[key] = {"codc": codc, "code": code, "error": True}
-            errors += 1
-
-        # Progress + periodic save
-        if (i + 1) % 50 == 0 or (i + 1) == len(to_scrape):
-            CACHE_FILE.write_text(
-                json.dumps(cache, ensure_ascii=False, indent=2), encoding="utf-8"
-            )
-            pct = (i + 1) / len(to_scrape) * 100 if to_scrape else 100
-            print(f"  [{pct:5.1f}%] {i+1}/{len(to_scrape)} — ok:{scraped} err:{errors}")
-
-        time.sleep(DELAY)
 
-    # Final cache save
-    CACHE_FILE.write_text(
-        json.dumps(cache, ensure_ascii=False, indent=2), encoding="utf-8"
+        # Progress (each result is already appended to the journal)
+        if done % 50 == 0 or done == len(jobs):
+            retry.save()
+            pct = done / len(jobs) * 100 if jobs else 100
+            print(f"  [{pct:5.1f}%] {done}/{len(jobs)} — ok:{scraped} err:{errors}  rate {CONTROL}")
+
+    fetch_all(
+        jobs,
+        lambda url: fetch(*jobs[url]),
+        concurrency=CONCURRENCY,
+        rate=None,   # POOL takes a token per request sent
+        on_result=on_result,
     )
+    retry.save()
+    POOL.close()
+    if jobs:
+        print(f"  {POOL.opened} connections opened for {len(jobs)} pages")
 
     print(f"\nGenerating SQL...")
     sql = generate_sql(cache, uo_to_ies)
+    cache.close()
     OUT_FILE.write_text(sql, encoding="utf-8")
     print(f"Written to {OUT_FILE}")
     print(f"\nRun order in Supabase SQL Editor:")
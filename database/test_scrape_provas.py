@@ -0,0 +1,70 @@
+"""
+CacheJournal recovery checks — stdlib unittest, no network:
+
+    python3 -m unittest database/test_scrape_provas.py
+"""
+
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from scrape_provas import CacheJournal  # noqa: E402
+
+
+class TornTailTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp  = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "provas_cache.jsonl"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _crash_mid_write(self) -> None:
+        """Two complete entries, then half a line — what a killed run leaves."""
+        j = CacheJournal(self.path)
+        j.put("a", {"conjuntos": [], "nota_minima": 95.0})
+        j.put("b", {"conjuntos": [], "nota_minima": 100.0})
+        j.save_index()
+        j._fh.close()
+        with open(self.path, "ab") as fh:
+            fh.write(b'{"key": "c", "entry": {"conj')
+
+    def test_reopen_drops_torn_line(self):
+        self._crash_mid_write()
+        j = CacheJournal(self.path)
+        self.assertEqual(sorted(j.offsets), ["a", "b"])
+        self.assertTrue(self.path.read_bytes().endswith(b"\n"))
+        j._fh.close()
+
+    def test_put_after_torn_tail(self):
+        self._crash_mid_write()
+        j = CacheJournal(self.path)
+        j.put("c", {"conjuntos": [], "nota_minima": 110.0})
+        self.assertEqual(j.get("c")["nota_minima"], 110.0)
+        self.assertEqual([k for k, _ in j.items()], ["a", "b", "c"])
+        j.close()
+
+        # A full rescan (no index) reads every line back
+        j.idx_path.unlink()
+        j = CacheJournal(self.path)
+        self.assertEqual(dict(j.items())["c"]["nota_minima"], 110.0)
+        self.assertEqual(j.lines, 3)
+        j._fh.close()
+
+    def test_compact_keeps_entry_written_after_torn_tail(self):
+        self._crash_mid_write()
+        j = CacheJournal(self.path)
+        j.put("a", {"conjuntos": [], "nota_minima": 90.0})
+        j.put("c", {"conjuntos": [], "nota_minima": 110.0})
+        j.compact(min_dead_ratio=0.0)
+        self.assertEqual(
+            {k: e["nota_minima"] for k, e in j.items()},
+            {"a": 90.0, "b": 100.0, "c": 110.0},
+        )
+        j.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Parser microbenchmarks over the pinned page corpus
+==================================================
+scripts/bench/corpus/*.html are detcursopi.asp pages (iso-8859-1, DGES
+layout), one per provas shape: simple list, "Uma das seguintes",
+"Duas das seguintes", "Um dos seguintes conjuntos" with "ou", required +
+optional, a private course with no Dados Estatísticos, and layout_edges (a
+repeated heading, a heading inside a container with text after it).
+
+Per page it times (best of 5 rounds, µs per call) and measures peak
+traced memory / retained blocks (tracemalloc) for:
+  - dges_parse.parse_detail
+  - scrape_dges.scrape_detail   (page store read + parse memo hit; skipped
+                                 when scrape_dges's dependencies are missing)
+  - scrape_provas.extract_section  (the three sections fetch() reads)
+  - scrape_provas.parse_provas / parse_formula / parse_minima
+
+scripts/bench/golden/<page>.json holds the expected output of parse_detail
+(both "Último Colocado" row rules) and of the scrape_provas pipeline; --check compares against it (exit 1 on
+any difference), so a faster parser can be shown to give identical results.
+--check also runs dges_parse's fast path and its BeautifulSoup fallback on
+every page and fails if they disagree (skipped without bs4).
+
+Each golden file also has a "baseline" block: what the two parsers
+parse_detail replaced gave for the page — scrape_dges.scrape_detail and
+import_supabase.parse_detail as of commit 839ef6e, before dges_parse
+existed. It was written once from that code and --update-golden keeps it
+as is. --check compares dges_parse against it too; the only differences
+allowed are the ones listed in BASELINE_DIFFS.
+
+Usage:
+    python scripts/bench/bench_parse.py
+    python scripts/bench/bench_parse.py --check
+    python scripts/bench/bench_parse.py --update-golden   # after an intended output change
+"""
+
+import argparse
+import importlib.util
+import json
+import sys
+import tempfile
+import timeit
+import tracemalloc
+from pathlib import Path
+
+BENCH_DIR  = Path(__file__).resolve().parent
+SCRIPT_DIR = BENCH_DIR.parent
+ROOT_DIR   = SCRIPT_DIR.parent
+sys.path.insert(0, str(SCRIPT_DIR))
+sys.path.insert(0, str(ROOT_DIR / "database"))
+
+import dges_parse  # noqa: E402
+from dges_parse import parse_detail, parse_detail_last_row  # noqa: E402
+import scrape_provas as sp  # noqa: E402
+
+CORPUS_DIR = BENCH_DIR / "corpus"
+GOLDEN_DIR = BENCH_DIR / "golden"
+
+# The section patterns scrape_provas.fetch() passes to extract_section
+SECTIONS = {
+    "provas":  "Provas de Ingresso",
+    "formula": r"F[oó]rmula de C[aá]lculo",
+    "minima":  r"Classifica[cç][oõ]es M[ií]nimas",
+}
+
+
+# Intended differences between dges_parse and the baseline parsers:
+#   against  — the golden output each baseline is compared with (each script
+#              keeps its own "Último Colocado" row rule — see dges_parse)
+#   renamed  — baseline key → dges_parse key
+#   added    — keys the baseline parser did not produce
+BASELINE_DIFFS = {
+    "scrape_dges": {
+        "against": "parse_detail",
+        "renamed": {"peso_exame": "peso_exames"},
+        "added":   {"vagas_2024_f1", "vagas_2024_f2", "vagas_2025_f1", "vagas_2025_f2"},
+    },
+    "import_supabase": {
+        "against": "parse_detail_last_row",
+        "renamed": {"nota_minima_p_ingresso": "nota_minima_candidatura"},
+        "added":   {"tipo"},
+    },
+}
+
+
+def load_corpus(only: str | None = None) -> dict[str, bytes]:
+    return {
+        p.stem: p.read_bytes()
+        for p in sorted(CORPUS_DIR.glob("*.html"))
+        if only is None or only in p.stem
+    }
+
+
+def provas_pipeline(raw: bytes) -> dict:
+    """What scrape_provas.fetch() extracts from a page, plus the section texts."""
+    html  = raw.decode("iso-8859-1")
+    texts = {name: sp.extract_section(html, pat) for name, pat in SECTIONS.items()}
+    peso_sec, peso_exam = sp.parse_formula(texts["formula"])
+    return {
+        "sections":        texts,
+        "conjuntos":       sp.parse_provas(texts["provas"]),
+        "peso_secundario": peso_sec,
+        "peso_exames":     peso_exam,
+        "nota_minima":     sp.parse_minima(texts["minima"]),
+    }
+
+
+def golden_for(raw: bytes) -> dict:
+    return {
+        "parse_detail":          parse_detail(raw),
+        "parse_detail_last_row": parse_detail_last_row(raw),
+        "scrape_provas":         provas_pipeline(raw),
+    }
+
+# ── scrape_dges.scrape_detail against a throw-away page store ────────────────
+
+def scrape_detail_setup(corpus: dict[str, bytes], tmp: Path):
+    """(scrape_detail, {page: (codc, code)}) or (None, reason)."""
+    try:
+        import scrape_dges as sd
+    except ImportError as exc:
+        return None, f"scrape_detail skipped — {exc}"
+    from dges_cache import PageStore, cache_key
+
+    sd.STORE = PageStore(tmp / "pages.sqlite")
+    codes = {}
+    for i, (name, raw) in enumerate(corpus.items()):
+        codc, code = f"B{i:03d}", "0000"
+        sd.STORE.put(cache_key(sd.DETAIL_URL.format(codc=codc, code=code)), raw)
+        codes[name] = (codc, code)
+    return sd.scrape_detail, codes
+
+# ── Measurement ───────────────────────────────────────────────────────────────
+
+def measure(fn, repeat: int) -> tuple[float, float, int]:
+    """(µs per call, peak KiB, blocks still allocated after one call)."""
+    best = min(timeit.repeat(fn, number=repeat, repeat=5)) / repeat
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(s.count_diff for s in after.compare_to(before, "filename"))
+    return best * 1e6, peak / 1024, blocks
+
+
+def run_bench(corpus: dict[str, bytes], repeat: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        scrape_detail, codes = scrape_detail_setup(corpus, Path(tmp))
+        if scrape_detail is None:
+            print(f"  ({codes})")
+
+        rows: list[tuple[str, str, float, float, int]] = []
+        for name, raw in corpus.items():
+            html  = raw.decode("iso-8859-1")
+            texts = {k: sp.extract_section(html, pat) for k, pat in SECTIONS.items()}
+            fns = {"parse_detail": lambda: parse_detail(raw)}
+            if scrape_detail is not None:
+                codc, code = codes[name]
+                scrape_detail(codc, code)   # first call fills the parse memo
+                fns["scrape_detail"] = lambda: scrape_detail(codc, code)
+            fns["extract_section"] = lambda: [sp.extract_section(html, p) for p in SECTIONS.values()]
+            fns["parse_provas"]    = lambda: sp.parse_provas(texts["provas"])
+            fns["parse_formula"]   = lambda: sp.parse_formula(texts["formula"])
+            fns["parse_minima"]    = lambda: sp.parse_minima(texts["minima"])
+            for fname, fn in fns.items():
+                rows.append((name, fname, *measure(fn, repeat)))
+
+    print(f"\n{'page':<22}{'function':<18}{'µs/call':>10}{'peak KiB':>10}{'blocks':>8}")
+    for name, fname, us, kib, blocks in rows:
+        print(f"{name:<22}{fname:<18}{us:>10.1f}{kib:>10.1f}{blocks:>8}")
+
+    print(f"\n{'total over corpus':<40}{'µs':>10}")
+    totals: dict[str, float] = {}
+    for _, fname, us, _, _ in rows:
+        totals[fname] = totals.get(fname, 0.0) + us
+    for fname, us in totals.items():
+        print(f"  {fname:<38}{us:>10.1f}")
+
+# ── Golden outputs ────────────────────────────────────────────────────────────
+
+def check_paths(name: str, raw: bytes) -> bool:
+    """The fast path and the tree fallback give the same fields (ignoring
+    _parser), under both nota row rules."""
+    ok = True
+    for nota_row in ("first", "last"):
+        fast = dges_parse._parse_fast(raw, nota_row)
+        tree = dges_parse._parse_tree(raw, nota_row)
+        if fast is None:
+            continue   # the fallback is the only result
+        fast = {k: v for k, v in fast.items() if k != "_parser"}
+        tree = {k: v for k, v in tree.items() if k != "_parser"}
+        if fast == tree:
+            continue
+        ok = False
+        print(f"  DIFF    {name}: fast path ≠ tree parser (nota_row={nota_row})")
+        for k in sorted(set(fast) | set(tree)):
+            if fast.get(k) != tree.get(k):
+                print(f"    {k}: fast {fast.get(k)!r}  tree {tree.get(k)!r}")
+    return ok
+
+
+def check_baseline(name: str, baseline: dict, golden: dict) -> bool:
+    """dges_parse matches each baseline parser up to BASELINE_DIFFS."""
+    ok = True
+    for parser, old in baseline.items():
+        diffs = BASELINE_DIFFS[parser]
+        got   = golden[diffs["against"]]
+        want  = {diffs["renamed"].get(k, k): v for k, v in old.items()}
+        skip  = diffs["added"] | {"_parser"}
+        keys  = sorted(k for k in set(want) | set(got) if k not in skip)
+        bad   = [k for k in keys if want.get(k) != got.get(k)]
+        if bad:
+            ok = False
+            print(f"  DIFF    {name}: {diffs['against']} ≠ baseline {parser}")
+            for k in bad:
+                print(f"    {k}: baseline {want.get(k)!r}  now {got.get(k)!r}")
+    return ok
+
+
+def check(corpus: dict[str, bytes]) -> int:
+    failures = 0
+    paths = importlib.util.find_spec("bs4") is not None
+    if not paths:
+        print("  (fast path vs tree parser skipped — bs4 not installed)")
+    with tempfile.TemporaryDirectory() as tmp:
+        scrape_detail, codes = scrape_detail_setup(corpus, Path(tmp))
+        for name, raw in corpus.items():
+            path = GOLDEN_DIR / f"{name}.json"
+            if not path.exists():
+                print(f"  MISSING {path.name} — run with --update-golden")
+                failures += 1
+                continue
+            want = json.loads(path.read_text(encoding="utf-8"))
+            baseline = want.pop("baseline", None)
+            got  = json.loads(json.dumps(golden_for(raw), ensure_ascii=False))
+            if scrape_detail is not None:
+                got["scrape_detail"] = scrape_detail(*codes[name])
+                want["scrape_detail"] = want["parse_detail"]
+            bad = [k for k in want if got.get(k) != want[k]]
+            if bad:
+                failures += 1
+                print(f"  DIFF    {name}: {', '.join(bad)}")
+                for k in bad:
+                    print(f"    want {k}: {json.dumps(want[k], ensure_ascii=False)}")
+                    print(f"    got  {k}: {json.dumps(got.get(k), ensure_ascii=False)}")
+            else:
+                print(f"  ok      {name}")
+            if baseline is None:
+                print(f"  MISSING {path.name}: no baseline block")
+                failures += 1
+            elif not check_baseline(name, baseline, got):
+                failures += 1
+            if paths and not check_paths(name, raw):
+                failures += 1
+        if scrape_detail is None:
+            print(f"  ({codes})")
+    return failures
+
+
+def update_golden(corpus: dict[str, bytes]) -> None:
+    GOLDEN_DIR.mkdir(exist_ok=True)
+    for name, raw in corpus.items():
+        path = GOLDEN_DIR / f"{name}.json"
+        golden = golden_for(raw)
+        if path.exists():   # the baseline block is frozen — carry it over
+            baseline = json.loads(path.read_text(encoding="utf-8")).get("baseline")
+            if baseline is not None:
+                golden["baseline"] = baseline
+        path.write_text(
+            json.dumps(golden, ensure_ascii=False, indent=2) + "\n", encoding="utf-8"
+        )
+        print(f"  wrote {path.relative_to(ROOT_DIR)}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Parser microbenchmarks over the pinned page corpus")
+    ap.add_argument("--check", action="store_true", help="compare outputs with golden/*.json")
+    ap.add_argument("--update-golden", action="store_true", help="rewrite golden/*.json")
+    ap.add_argument("--repeat", type=int, default=200, help="calls per timing round")
+    ap.add_argument("--only", default=None, help="only pages whose name contains this")
+    args = ap.parse_args()
+
+    corpus = load_corpus(args.only)
+    if not corpus:
+        sys.exit(f"No pages in {CORPUS_DIR}")
+    print(f"Corpus: {len(corpus)} pages")
+
+    if args.update_golden:
+        update_golden(corpus)
+    elif args.check:
+        failures = check(corpus)
+        if failures:
+            sys.exit(f"{failures} page(s) differ from golden output")
+        print("All outputs match golden.")
+    else:
+        run_bench(corpus, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+End-to-end scraping throughput benchmark
+========================================
+Starts the local DGES stand-in (dges_standin.py) and runs, against it and
+with throw-away caches:
+  - dges   → scrape_dges.prefetch + scrape_dges.build_rows (as in its main)
+  - provas → database/scrape_provas.main
+using the courses in database/data/vagas.csv. Reports pages/sec, p50/p99
+request latency as seen by the scraper, and retries (requests served
+beyond one per page), so concurrency / rate-control changes can be
+compared offline.
+
+Usage:
+    python scripts/bench/bench_scrape.py
+    python scripts/bench/bench_scrape.py --only provas --limit 300 --latency 200 \\
+        --error-rate 0.02 --burst-every 20 --burst-len 2 --max-rate 20
+"""
+
+import argparse
+import csv
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+BENCH_DIR  = Path(__file__).resolve().parent
+SCRIPT_DIR = BENCH_DIR.parent
+ROOT_DIR   = SCRIPT_DIR.parent
+sys.path.insert(0, str(SCRIPT_DIR))
+sys.path.insert(0, str(ROOT_DIR / "database"))
+
+from dges_fetch import AdaptiveRate, ConnectionPool, RetryQueue, TokenBucket  # noqa: E402
+import dges_standin  # noqa: E402
+
+VAGAS_FILE = ROOT_DIR / "database" / "data" / "vagas.csv"
+
+
+class RecordingRate(AdaptiveRate):
+    """AdaptiveRate that also keeps every observed latency for the report."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies: list[float] = []
+
+    def observe(self, latency: float, status: int | None) -> None:
+        self.latencies.append(latency)
+        super().observe(latency, status)
+
+
+def _pct(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    v = sorted(values)
+    return v[min(len(v) - 1, int(round(p * (len(v) - 1))))]
+
+
+@contextmanager
+def patched(module, **attrs):
+    """Set module globals for one benchmark run and put the originals back after."""
+    saved = {k: getattr(module, k) for k in attrs}
+    for k, v in attrs.items():
+        setattr(module, k, v)
+    try:
+        yield module
+    finally:
+        for k, v in saved.items():
+            setattr(module, k, v)
+
+
+def load_courses(limit: int | None) -> list[dict]:
+    with open(VAGAS_FILE, encoding="utf-8-sig") as f:
+        rows = list(csv.DictReader(f))
+    return rows[:limit] if limit else rows
+
+
+def bench_dges(url: str, rows: list[dict], tmp: Path, control: RecordingRate, concurrency: int) -> int:
+    import scrape_dges as sd
+    from dges_cache import PageStore
+    from dges_xlsx import row_type
+
+    Par   = row_type(sd.PARES_COLUMNS)
+    pares = [Par(*(r.get(h) for h in sd.PARES_COLUMNS.values())) for r in rows]
+    urls  = list(dict.fromkeys(
+        url.format(codc=sd._s(r.cod_curso), code=sd._s(r.cod_uo))
+        for r in pares
+        if sd._s(r.curso) and sd._s(r.cod_uo) and sd._s(r.cod_curso)
+    ))
+    # _fetch paces itself through BUCKET, which must read the benchmark's rate
+    with patched(
+        sd,
+        DETAIL_URL=url,
+        STORE=PageStore(tmp / "dges" / "pages.sqlite"),
+        RETRY=RetryQueue(tmp / "dges" / "retry.json"),
+        CONTROL=control,
+        BUCKET=TokenBucket(control),
+        CONCURRENCY=concurrency,
+    ):
+        sd.prefetch(urls)
+        sd.build_rows(pares, {}, {})
+    return len(urls)
+
+
+def bench_provas(url: str, rows: list[dict], tmp: Path, control: RecordingRate, concurrency: int) -> int:
+    import scrape_provas as sp
+
+    vagas = tmp / "vagas.csv"
+    with open(vagas, "w", encoding="utf-8", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=list(rows[0]))
+        w.writeheader()
+        w.writerows(rows)
+
+    with patched(
+        sp,
+        DGES_URL=url,
+        VAGAS_FILE=vagas,
+        CACHE_FILE=tmp / "none.json",
+        JOURNAL=tmp / "provas_cache.jsonl",
+        RETRY_FILE=tmp / "provas_retry.json",
+        OUT_FILE=tmp / "provas_import.sql",
+        CONTROL=control,
+        CONCURRENCY=concurrency,
+        POOL=ConnectionPool(max_idle=concurrency, bucket=TokenBucket(control), control=control),
+    ):
+        sp.main()
+        return len(sp.load_vagas()[0])
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Scraper throughput against the local DGES stand-in")
+    ap.add_argument("--only", choices=["dges", "provas"], default=None)
+    ap.add_argument("--limit", type=int, default=300, help="courses from vagas.csv (0 = all)")
+    ap.add_argument("--concurrency", type=int, default=6)
+    ap.add_argument("--start-rate", type=float, default=1.0)
+    ap.add_argument("--max-rate", type=float, default=2.5, help="rate ceiling (req/s)")
+    ap.add_argument("--store", type=Path, default=SCRIPT_DIR / "cache" / "pages.sqlite")
+    ap.add_argument("--pages", type=Path, default=BENCH_DIR / "corpus", help="directory of recorded .html pages")
+    ap.add_argument("--latency", type=float, default=150, help="ms")
+    ap.add_argument("--jitter", type=float, default=50, help="ms")
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--burst-every", type=float, default=0.0, help="s")
+    ap.add_argument("--burst-len", type=float, default=0.0, help="s")
+    args = ap.parse_args()
+
+    rows  = load_courses(args.limit or None)
+    pages = dges_standin.load_pages(args.store, args.pages)
+    targets = {"dges": bench_dges, "provas": bench_provas}
+    if args.only:
+        targets = {args.only: targets[args.only]}
+
+    report = []
+    for name, run in targets.items():
+        st = dges_standin.Standin(
+            pages, args.latency / 1000, args.jitter / 1000, args.error_rate,
+            args.burst_every, args.burst_len,
+        )
+        server, url = dges_standin.start(st)
+        control = RecordingRate(start=args.start_rate, ceiling=args.max_rate)
+        with tempfile.TemporaryDirectory() as tmp:
+            t0 = time.perf_counter()
+            n = run(url, rows, Path(tmp), control, args.concurrency)
+            wall = time.perf_counter() - t0
+        server.shutdown()
+        lat = control.latencies
+        report.append((
+            name, n, wall, n / wall if wall else 0.0,
+            statistics.median(lat) if lat else 0.0, _pct(lat, 0.99),
+            st.requests, max(0, st.requests - n), st.counts, control.rate,
+        ))
+
+    print()
+    print(f"{'target':<8}{'pages':>7}{'wall s':>9}{'pages/s':>9}{'p50 ms':>8}{'p99 ms':>8}"
+          f"{'reqs':>7}{'retries':>9}  final rate  statuses")
+    for name, n, wall, pps, p50, p99, reqs, retries, counts, rate in report:
+        print(f"{name:<8}{n:>7}{wall:>9.1f}{pps:>9.2f}{p50 * 1000:>8.0f}{p99 * 1000:>8.0f}"
+              f"{reqs:>7}{retries:>9}  {rate:>6.2f}/s    {dict(sorted(counts.items()))}")
+
+
+if __name__ == "__main__":
+    main()
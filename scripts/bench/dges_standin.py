@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Local DGES stand-in — stdlib only
+=================================
+Serves recorded detcursopi.asp pages over HTTP/1.1 keep-alive so scraper
+throughput can be measured offline. Pages come from the packed page store
+(scripts/cache/pages.sqlite) and/or a directory of .html files (by default
+the pinned corpus in scripts/bench/corpus); a course with no recorded page
+gets one of the recorded pages picked by its codes.
+
+Fault injection:
+  --latency / --jitter   per-request service time (ms)
+  --error-rate           fraction of requests answered 503
+  --burst-every / --burst-len
+                         every N s, answer 429 (Retry-After) for M s
+
+Conditional GETs (If-None-Match) get a 304, like the real server's ETags.
+
+Usage:
+    python scripts/bench/dges_standin.py --port 8089 --latency 150 --error-rate 0.01
+    DETAIL_URL → http://127.0.0.1:8089/guias/detcursopi.asp?codc={codc}&code={code}
+"""
+
+import argparse
+import hashlib
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+SCRIPT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SCRIPT_DIR))
+from dges_cache import PageStore, cache_key  # noqa: E402
+
+DGES_DETAIL_URL = "https://www.dges.gov.pt/guias/detcursopi.asp?codc={codc}&code={code}"
+
+FALLBACK_PAGE = (
+    "<html><head><meta charset=\"iso-8859-1\"></head><body>"
+    "<h2>Endereço</h2>Rua X<br>1000-001 LISBOA<br>Tel 210 000 000"
+    "<h2>Características</h2>Ensino Público"
+    "<h2>Provas de Ingresso</h2>Uma das seguintes provas:<br>07 Física e Química<br>16 Matemática"
+    "<h2>Classificações Mínimas</h2>Nota de candidatura: 100 pontos<br>Provas de ingresso: 95 pontos"
+    "<h2>Fórmula de Cálculo</h2>Média do secundário: 50%<br>Provas de ingresso: 50%"
+    "<h2>Dados Estatísticos</h2><table><tr><td></td><td>2024</td><td>2025</td></tr>"
+    "<tr><td></td><td>1ª</td><td>2ª</td><td>1ª</td><td>2ª</td></tr>"
+    "<tr><td>Vagas</td><td>40</td><td>2</td><td>42</td><td>1</td></tr>"
+    "<tr><td>Nota do Último Colocado</td><td>150,2</td><td>151,0</td><td>152,4</td><td></td></tr>"
+    "</table></body></html>"
+).encode("iso-8859-1")
+
+
+class Standin:
+    """Recorded pages + fault-injection settings + request counters."""
+
+    def __init__(
+        self,
+        pages: dict[str, bytes],
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        burst_every: float = 0.0,
+        burst_len: float = 0.0,
+        retry_after: int = 1,
+    ):
+        self.pages       = pages
+        self.fallback    = list(pages.values()) or [FALLBACK_PAGE]
+        self.latency     = latency
+        self.jitter      = jitter
+        self.error_rate  = error_rate
+        self.burst_every = burst_every
+        self.burst_len   = burst_len
+        self.retry_after = retry_after
+        self.started     = time.monotonic()
+        self.counts: dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def page_for(self, codc: str, code: str) -> bytes:
+        page = self.pages.get(cache_key(DGES_DETAIL_URL.format(codc=codc, code=code)))
+        if page is not None:
+            return page
+        h = int(hashlib.md5(f"{codc}/{code}".encode()).hexdigest(), 16)
+        return self.fallback[h % len(self.fallback)]
+
+    def in_burst(self) -> bool:
+        if not self.burst_every:
+            return False
+        return (time.monotonic() - self.started) % self.burst_every < self.burst_len
+
+    def count(self, status: int) -> None:
+        with self._lock:
+            self.counts[status] = self.counts.get(status, 0) + 1
+
+    @property
+    def requests(self) -> int:
+        return sum(self.counts.values())
+
+
+def load_pages(store: Path | None, pages_dir: Path | None) -> dict[str, bytes]:
+    pages: dict[str, bytes] = {}
+    if store is not None and store.exists():
+        s = PageStore(store)
+        for key in s.keys():
+            pages[key] = s.get(key)
+    if pages_dir is not None and pages_dir.is_dir():
+        for p in sorted(pages_dir.glob("*.html")):
+            pages[p.stem] = p.read_bytes()
+    return pages
+
+
+def make_handler(st: Standin):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status: int, body: bytes = b"", headers: dict | None = None):
+            st.count(status)
+            self.send_response(status)
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if body:
+                self.wfile.write(body)
+
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            if parts.path != "/guias/detcursopi.asp":
+                return self._send(404)
+            if st.in_burst():
+                return self._send(429, headers={"Retry-After": str(st.retry_after)})
+            if st.latency or st.jitter:
+                time.sleep(max(0.0, st.latency + random.uniform(-st.jitter, st.jitter)))
+            if random.random() < st.error_rate:
+                return self._send(503)
+
+            q = parse_qs(parts.query)
+            page = st.page_for(q.get("codc", [""])[0], q.get("code", [""])[0])
+            etag = '"' + hashlib.md5(page).hexdigest() + '"'
+            if self.headers.get("If-None-Match") == etag:
+                return self._send(304, headers={"ETag": etag})
+            self._send(200, page, {
+                "Content-Type":  "text/html; charset=iso-8859-1",
+                "ETag":          etag,
+                "Last-Modified": "Mon, 16 Feb 2026 00:00:00 GMT",
+            })
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def start(st: Standin, port: int = 0) -> tuple[ThreadingHTTPServer, str]:
+    """Serve `st` on a daemon thread; returns (server, DETAIL_URL template)."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(st))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    return server, base + "/guias/detcursopi.asp?codc={codc}&code={code}"
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    ap.add_argument("--port", type=int, default=8089)
+    ap.add_argument("--store", type=Path, default=SCRIPT_DIR / "cache" / "pages.sqlite")
+    ap.add_argument("--pages", type=Path, default=Path(__file__).resolve().parent / "corpus",
+                    help="directory of <cache_key>.html pages")
+    ap.add_argument("--latency", type=float, default=100, help="ms")
+    ap.add_argument("--jitter", type=float, default=50, help="ms")
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--burst-every", type=float, default=0.0, help="s")
+    ap.add_argument("--burst-len", type=float, default=0.0, help="s")
+    args = ap.parse_args()
+
+    pages = load_pages(args.store, args.pages)
+    st = Standin(pages, args.latency / 1000, args.jitter / 1000, args.error_rate,
+                 args.burst_every, args.burst_len)
+    server, url = start(st, args.port)
+    print(f"Serving {len(pages) or 'fallback'} pages — DETAIL_URL = {url}")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"  {st.requests} requests  {st.counts}")
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
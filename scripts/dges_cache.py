@@ -0,0 +1,296 @@
+"""
+Packed DGES page store
+======================
+One SQLite file (scripts/cache/pages.sqlite) instead of one HTML file per URL.
+Each page body is compressed on its own (zstd when the `zstandard` package is
+installed, zlib otherwise) and stored with its HTTP validators, so lookups are
+a single indexed read with no filesystem stat per course.
+
+Pages are keyed by `cache_key(url)` — the same key the old ./cache/<key>
+files used — and a legacy cache directory is imported once on first open;
+the loose files are deleted once they read back intact from the store.
+
+The store also memoizes parse results by (parser, version, hash of the raw
+bytes): an unchanged page gives back its stored detail dict without building
+a BeautifulSoup tree. Bump the parser's version whenever its output changes.
+
+Usage:
+    from dges_cache import PageStore, cache_key
+    from dges_parse import PARSER_VERSION, parse_detail
+    store = PageStore(CACHE_DIR / "pages.sqlite")
+    raw = store.get(cache_key(url))
+    detail = store.memo_parse(raw, "dges_parse", PARSER_VERSION, parse_detail)
+    details = store.memo_parse_many(raws, "dges_parse", PARSER_VERSION, parse_detail, workers=4)
+"""
+
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable
+
+try:
+    import zstandard
+except ImportError:  # optional — zlib is always available
+    zstandard = None
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    key           TEXT PRIMARY KEY,
+    codec         TEXT NOT NULL,
+    body          BLOB NOT NULL,
+    size          INTEGER NOT NULL,
+    etag          TEXT,
+    last_modified TEXT,
+    fetched_at    REAL
+);
+CREATE TABLE IF NOT EXISTS parsed (
+    digest  TEXT NOT NULL,
+    parser  TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    detail  TEXT NOT NULL,
+    PRIMARY KEY (digest, parser, version)
+);
+CREATE TABLE IF NOT EXISTS store_meta (
+    name  TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def cache_key(url: str) -> str:
+    return re.sub(r"[^\w]", "_", url)[:180]
+
+
+def _digest(raw: bytes) -> str:
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+def _compress(raw: bytes) -> tuple[str, bytes]:
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=9).compress(raw)
+    return "zlib", zlib.compress(raw, 9)
+
+
+def _decompress(codec: str, blob: bytes) -> bytes:
+    if codec == "zlib":
+        return zlib.decompress(blob)
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("page stored with zstd — pip install zstandard to read it")
+        return zstandard.ZstdDecompressor().decompress(blob)
+    if codec == "raw":
+        return blob
+    raise ValueError(f"unknown codec {codec!r}")
+
+
+class PageStore:
+    """Thread-safe key → page store; one connection shared under a lock."""
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path  = path
+        self._lock = threading.Lock()
+        self._db   = sqlite3.connect(str(path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self.parse_hits = self.parse_misses = 0
+        self._import_legacy_dir(path.parent)
+
+    # ── Reads ────────────────────────────────────────────────────────────────
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT codec, body FROM pages WHERE key = ?", (key,)
+            ).fetchone()
+        return _decompress(*row) if row else None
+
+    def meta(self, key: str) -> dict:
+        """Validators for `key`: {etag, last_modified, fetched_at}, or {}."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT etag, last_modified, fetched_at FROM pages WHERE key = ?", (key,)
+            ).fetchone()
+        if not row:
+            return {}
+        return {"etag": row[0], "last_modified": row[1], "fetched_at": row[2]}
+
+    def keys(self) -> set[str]:
+        with self._lock:
+            return {k for (k,) in self._db.execute("SELECT key FROM pages")}
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return self._db.execute(
+                "SELECT 1 FROM pages WHERE key = ?", (key,)
+            ).fetchone() is not None
+
+    # ── Writes ───────────────────────────────────────────────────────────────
+
+    def put(
+        self,
+        key: str,
+        raw: bytes,
+        etag: str | None = None,
+        last_modified: str | None = None,
+        fetched_at: float | None = None,
+    ) -> None:
+        codec, blob = _compress(raw)
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, codec, blob, len(raw), etag, last_modified,
+                 time.time() if fetched_at is None else fetched_at),
+            )
+
+    def touch(self, key: str, fetched_at: float | None = None) -> None:
+        """Mark `key` as revalidated (304) without rewriting its body."""
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE pages SET fetched_at = ? WHERE key = ?",
+                (time.time() if fetched_at is None else fetched_at, key),
+            )
+
+    def stats(self) -> tuple[int, int, int]:
+        """(pages, raw bytes, stored bytes)."""
+        with self._lock:
+            n, raw, stored = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(LENGTH(body)), 0) FROM pages"
+            ).fetchone()
+        return n, raw, stored
+
+    # ── Parse memo ───────────────────────────────────────────────────────────
+
+    def memo_parse(
+        self,
+        raw: bytes,
+        parser: str,
+        version: int,
+        parse: Callable[[bytes], dict],
+    ) -> dict:
+        """`parse(raw)`, served from the memo when these exact bytes were seen before."""
+        digest = _digest(raw)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT detail FROM parsed WHERE digest = ? AND parser = ? AND version = ?",
+                (digest, parser, version),
+            ).fetchone()
+        if row:
+            self.parse_hits += 1
+            return json.loads(row[0])
+        self.parse_misses += 1
+        detail = parse(raw)
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO parsed VALUES (?, ?, ?, ?)",
+                (digest, parser, version, json.dumps(detail, ensure_ascii=False)),
+            )
+        return detail
+
+    def memo_parse_many(
+        self,
+        raws: list[bytes | None],
+        parser: str,
+        version: int,
+        parse: Callable[[bytes], dict],
+        workers: int = 1,
+        chunksize: int = 16,
+    ) -> list[dict | None]:
+        """
+        `memo_parse` over a batch, in input order (None stays None).
+
+        Memo misses are parsed on a ProcessPoolExecutor with `workers`
+        processes, `chunksize` pages per task; `parse` must be a module-level
+        function of an importable module (dges_parse.parse_detail), not one
+        defined in the running script, so spawn-started workers can load it.
+        """
+        if workers > 1 and getattr(parse, "__module__", "__main__") == "__main__":
+            raise ValueError(f"{parse!r} is defined in __main__ — workers cannot import it")
+        digests = [None if raw is None else _digest(raw) for raw in raws]
+        wanted  = list({d for d in digests if d is not None})
+        found: dict[str, dict] = {}
+        with self._lock:
+            for i in range(0, len(wanted), 500):
+                batch = wanted[i : i + 500]
+                marks = ",".join("?" * len(batch))
+                for d, detail in self._db.execute(
+                    f"SELECT digest, detail FROM parsed "
+                    f"WHERE parser = ? AND version = ? AND digest IN ({marks})",
+                    (parser, version, *batch),
+                ):
+                    found[d] = json.loads(detail)
+
+        todo: dict[str, bytes] = {}
+        for d, raw in zip(digests, raws):
+            if d is not None and d not in found:
+                todo.setdefault(d, raw)
+        self.parse_hits   += sum(1 for d in digests if d in found)
+        self.parse_misses += len(todo)
+
+        if workers > 1 and len(todo) > chunksize:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                parsed = list(pool.map(parse, todo.values(), chunksize=chunksize))
+        else:
+            parsed = [parse(raw) for raw in todo.values()]
+
+        fresh = dict(zip(todo, parsed))
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO parsed VALUES (?, ?, ?, ?)",
+                [(d, parser, version, json.dumps(v, ensure_ascii=False)) for d, v in fresh.items()],
+            )
+        found.update(fresh)
+        return [None if d is None else found[d] for d in digests]
+
+    # ── One-off migration from the one-file-per-URL cache ────────────────────
+
+    def _import_legacy_dir(self, cache_dir: Path) -> None:
+        """
+        Copy the old <cache_key> page files (and their .meta.json sidecars)
+        into the store once, then delete every file whose page reads back
+        byte-identical from the store. Anything that does not is left in
+        place.
+        """
+        with self._lock:
+            done = self._db.execute(
+                "SELECT 1 FROM store_meta WHERE name = 'legacy_imported'"
+            ).fetchone()
+        if done:
+            return
+        imported: list[Path] = []
+        for p in cache_dir.iterdir():
+            # cache_key() names are plain \w — skips the store's own -wal/-shm,
+            # retry.json, checkpoints and sidecars
+            if not p.is_file() or not re.fullmatch(r"\w+", p.name):
+                continue
+            meta = {}
+            side = p.with_name(p.name + ".meta.json")
+            if side.exists():
+                try:
+                    meta = json.loads(side.read_text(encoding="utf-8"))
+                except ValueError:
+                    pass
+            self.put(
+                p.name,
+                p.read_bytes(),
+                etag=meta.get("etag"),
+                last_modified=meta.get("last_modified"),
+                fetched_at=meta.get("fetched_at", p.stat().st_mtime),
+            )
+            imported.append(p)
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO store_meta VALUES ('legacy_imported', ?)",
+                (str(time.time()),),
+            )
+        for p in imported:
+            if self.get(p.name) == p.read_bytes():
+                p.unlink()
+                p.with_name(p.name + ".meta.json").unlink(missing_ok=True)
@@ -0,0 +1,470 @@
+"""
+Concurrent DGES page fetcher — stdlib only, no pip required
+===========================================================
+Keeps up to `concurrency` requests in flight while a token bucket per host
+caps the request rate, so a cold scrape runs at the agreed rate instead of
+one page + sleep at a time.
+
+The HTTP call itself is a plain blocking function (requests.Session.get,
+urllib, …) run on a worker thread, so each scraper keeps its own client and
+error handling. Results are reported through `on_result` on the event-loop
+thread, one at a time — safe for writing to the existing cache stores.
+
+The rate can be a fixed number or an AdaptiveRate controller (AIMD): it
+adds a little rate while p95 latency and error rate stay low, halves it on
+429/503, never goes above its configured ceiling, and its str() is meant
+for progress logs. The scrapers feed it one observe() per HTTP attempt.
+
+ConnectionPool is a thread-safe keep-alive pool over http.client, so
+stdlib-only callers reuse TCP+TLS connections across fetch_all's worker
+threads instead of paying a handshake per page.
+
+Pages that still fail go into a persistent RetryQueue instead of being
+cached as errors: each gets exponential backoff with jitter (at least the
+server's Retry-After) and is given up after RetryPolicy.max_attempts, so a
+rerun only targets pages whose backoff has expired.
+
+Usage:
+    from dges_fetch import fetch_all
+    results = fetch_all(urls, get_one, concurrency=6, rate=2.5)
+
+    pool = ConnectionPool(max_idle=6)
+    resp = pool.get(url, headers={"User-Agent": "..."}, timeout=12)   # .status .headers .body
+
+    control = AdaptiveRate(start=1.0, ceiling=2.5)
+    results = fetch_all(urls, get_one, rate=control)   # get_one calls control.observe(...)
+
+    retry = RetryQueue(CACHE_DIR / "retry.json")
+    todo  = [u for u in urls if retry.due(u)]
+    ...
+    retry.fail(url, "HTTP 503", retry_after=parse_retry_after(headers.get("Retry-After")))
+    retry.done(url)
+    retry.save()
+"""
+
+import asyncio
+import http.client
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Callable, Iterable
+from urllib.parse import urljoin, urlsplit
+
+
+class AdaptiveRate:
+    """
+    AIMD request-rate controller, shared by every worker thread.
+
+    Each observe() records one request's latency and status (None = network
+    error or timeout). Every `step_every` healthy requests the rate grows by
+    `increase` req/s if p95 latency ≤ `target_p95` and the error rate ≤
+    `max_error_rate`; it shrinks by ×0.8 when p95 runs at twice the target.
+    A 429/503 (or other 5xx / timeout) multiplies it by `decrease` at once,
+    then holds it for `cooldown` seconds so one burst counts once.
+    """
+
+    def __init__(
+        self,
+        start: float,
+        ceiling: float,
+        floor: float = 0.2,
+        increase: float = 0.25,
+        decrease: float = 0.5,
+        target_p95: float = 1.5,
+        max_error_rate: float = 0.02,
+        step_every: int = 10,
+        window: int = 50,
+        cooldown: float = 10.0,
+    ):
+        self.ceiling        = ceiling
+        self.floor          = floor
+        self.rate           = max(floor, min(start, ceiling))
+        self.increase       = increase
+        self.decrease       = decrease
+        self.target_p95     = target_p95
+        self.max_error_rate = max_error_rate
+        self.step_every     = step_every
+        self.cooldown       = cooldown
+        self._lat: deque[float] = deque(maxlen=window)
+        self._err: deque[bool]  = deque(maxlen=window)
+        self._ok   = 0
+        self._hold = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, latency: float, status: int | None) -> None:
+        failed = status is None or status == 429 or status >= 500
+        with self._lock:
+            self._lat.append(latency)
+            self._err.append(failed)
+            now = time.monotonic()
+            if failed:
+                if now >= self._hold:
+                    self.rate  = max(self.floor, self.rate * self.decrease)
+                    self._hold = now + self.cooldown
+                    self._ok   = 0
+                return
+            if now < self._hold:
+                return
+            self._ok += 1
+            if self._ok < self.step_every:
+                return
+            self._ok = 0
+            p95 = self._p95()
+            if p95 <= self.target_p95 and self._error_rate() <= self.max_error_rate:
+                self.rate = min(self.ceiling, self.rate + self.increase)
+            elif p95 > 2 * self.target_p95:
+                self.rate = max(self.floor, self.rate * 0.8)
+
+    def _p95(self) -> float:
+        lat = sorted(self._lat)
+        return lat[int(0.95 * (len(lat) - 1))] if lat else 0.0
+
+    def _error_rate(self) -> float:
+        return sum(self._err) / len(self._err) if self._err else 0.0
+
+    def __str__(self) -> str:
+        with self._lock:
+            return (f"{self.rate:.2f} req/s (max {self.ceiling:g}, "
+                    f"p95 {self._p95():.2f}s, err {self._error_rate():.0%})")
+
+
+class TokenBucket:
+    """
+    Token bucket: `rate` tokens per second, at most `burst` saved up.
+    acquire() waits on the event loop, take() blocks the calling thread;
+    both draw from the same tokens.
+    """
+
+    def __init__(self, rate: "float | AdaptiveRate", burst: int = 1):
+        self.rate   = rate
+        self.burst  = burst
+        self._tokens = float(burst)
+        self._last   = time.monotonic()
+        self._lock   = threading.Lock()
+
+    def _rate(self) -> float:
+        return self.rate.rate if isinstance(self.rate, AdaptiveRate) else self.rate
+
+    def _grab(self) -> float:
+        """Take a token if one is there (→ 0), else return how long to wait."""
+        with self._lock:
+            now  = time.monotonic()
+            rate = self._rate()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * rate)
+            self._last = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return min(1.0, (1 - self._tokens) / rate)
+
+    async def acquire(self) -> None:
+        while wait := self._grab():
+            await asyncio.sleep(wait)
+
+    def take(self) -> None:
+        while wait := self._grab():
+            time.sleep(wait)
+
+
+async def _run(
+    urls: list[str],
+    get_one: Callable[[str], object],
+    concurrency: int,
+    rate: "float | AdaptiveRate | None",
+    burst: int,
+    on_result: Callable[[str, object], None] | None,
+) -> dict[str, object]:
+    loop    = asyncio.get_running_loop()
+    sem     = asyncio.Semaphore(concurrency)
+    buckets: dict[str, TokenBucket] = {}
+    results: dict[str, object] = {}
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+
+        async def one(url: str) -> None:
+            async with sem:
+                if rate is not None:
+                    host = urlsplit(url).netloc
+                    await buckets.setdefault(host, TokenBucket(rate, burst)).acquire()
+                try:
+                    res = await loop.run_in_executor(pool, get_one, url)
+                except Exception as exc:
+                    res = exc
+            results[url] = res
+            if on_result is not None:
+                on_result(url, res)
+
+        await asyncio.gather(*(one(u) for u in urls))
+
+    return results
+
+
+def fetch_all(
+    urls: Iterable[str],
+    get_one: Callable[[str], object],
+    *,
+    concurrency: int = 6,
+    rate: "float | AdaptiveRate | None" = 2.5,
+    burst: int = 1,
+    on_result: Callable[[str, object], None] | None = None,
+) -> dict[str, object]:
+    """
+    Fetch every URL with `get_one(url)` on a thread pool.
+
+    At most `concurrency` calls run at once and each host gets at most `rate`
+    requests per second (re-read on every request when it is an AdaptiveRate).
+    Pass rate=None when `get_one` takes its own TokenBucket tokens — e.g. one
+    per retry or redirect. Returns url → result; an exception raised by
+    `get_one` is returned in place of the result, never re-raised.
+    """
+    urls = list(dict.fromkeys(urls))
+    if not urls:
+        return {}
+    return asyncio.run(_run(urls, get_one, concurrency, rate, burst, on_result))
+
+
+# ── Keep-alive connection pool ────────────────────────────────────────────────
+
+class PooledResponse:
+    def __init__(self, status: int, headers, body: bytes, url: str):
+        self.status  = status
+        self.headers = headers   # http.client.HTTPMessage (case-insensitive .get)
+        self.body    = body
+        self.url     = url
+
+
+class ConnectionPool:
+    """
+    Idle HTTP(S) connections per (scheme, host, port), reused LIFO.
+    Safe to share between threads; a connection is only ever used by the
+    thread that took it out of the pool.
+
+    With a `bucket`, every request sent takes a token first — redirect hops
+    and the retry after a dropped keep-alive connection included — and with
+    a `control` each answer (or timeout / network error) is observed by it.
+    """
+
+    def __init__(
+        self,
+        max_idle: int = 6,
+        bucket: TokenBucket | None = None,
+        control: AdaptiveRate | None = None,
+    ):
+        self.max_idle = max_idle
+        self.bucket   = bucket
+        self.control  = control
+        self._idle: dict[tuple[str, str, int], list[http.client.HTTPConnection]] = {}
+        self._lock = threading.Lock()
+        self.opened = 0   # new connections — handshakes paid
+
+    def _take(self, scheme: str, host: str, port: int, timeout: float, fresh: bool = False):
+        """An idle connection (→ conn, True) or, with `fresh` or none idle, a new one."""
+        with self._lock:
+            idle = self._idle.get((scheme, host, port))
+            if idle and not fresh:
+                conn = idle.pop()
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                return conn, True
+            self.opened += 1
+        cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return cls(host, port, timeout=timeout), False
+
+    def _drain(self, key: tuple[str, str, int]) -> None:
+        with self._lock:
+            conns = self._idle.pop(key, [])
+        for c in conns:
+            c.close()
+
+    def _give(self, key: tuple[str, str, int], conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        headers: dict | None = None,
+        timeout: float = 30,
+    ) -> PooledResponse:
+        parts  = urlsplit(url)
+        scheme = parts.scheme or "http"
+        port   = parts.port or (443 if scheme == "https" else 80)
+        key    = (scheme, parts.hostname, port)
+        path   = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        for fresh_retry in (False, True):
+            conn, reused = self._take(*key, timeout, fresh=fresh_retry)
+            if self.bucket is not None:
+                self.bucket.take()
+            t0 = time.monotonic()
+            try:
+                conn.request(method, path, headers=headers or {})
+                resp = conn.getresponse()
+                body = resp.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                conn.close()
+                if reused and not fresh_retry:
+                    # The server dropped an idle keep-alive connection; the
+                    # others idle for this host are likely gone too. Retry
+                    # once on a new connection (not a server error — not observed).
+                    self._drain(key)
+                    continue
+                self._observe(t0, None)
+                raise
+            except Exception:
+                conn.close()
+                self._observe(t0, None)
+                raise
+            self._observe(t0, resp.status)
+            if resp.will_close:
+                conn.close()
+            else:
+                self._give(key, conn)
+            return PooledResponse(resp.status, resp.headers, body, url)
+
+    def _observe(self, t0: float, status: int | None) -> None:
+        if self.control is not None:
+            self.control.observe(time.monotonic() - t0, status)
+
+    def get(
+        self,
+        url: str,
+        headers: dict | None = None,
+        timeout: float = 30,
+        max_redirects: int = 3,
+    ) -> PooledResponse:
+        """GET following up to `max_redirects` redirects (like urlopen)."""
+        for _ in range(max_redirects + 1):
+            resp = self.request("GET", url, headers, timeout)
+            location = resp.headers.get("Location")
+            if resp.status not in (301, 302, 303, 307, 308) or not location:
+                return resp
+            url = urljoin(url, location)
+        return resp
+
+    def close(self) -> None:
+        with self._lock:
+            conns = [c for idle in self._idle.values() for c in idle]
+            self._idle.clear()
+        for c in conns:
+            c.close()
+
+
+# ── Retry queue ───────────────────────────────────────────────────────────────
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Retry-After header (delta-seconds or HTTP-date) → seconds from now."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def transient(status: int | None) -> bool:
+    """Worth retrying later: no response at all (timeout, network), 408, 429 or 5xx.
+    Any other 4xx is the server's final answer for that URL."""
+    return status is None or status in (408, 429) or status >= 500
+
+
+class RetryPolicy:
+    """Exponential backoff: base * factor^(n-1), capped, ± jitter, ≥ Retry-After."""
+
+    def __init__(
+        self,
+        base: float = 60.0,
+        factor: float = 4.0,
+        cap: float = 24 * 3600,
+        jitter: float = 0.25,
+        max_attempts: int = 5,
+    ):
+        self.base         = base
+        self.factor       = factor
+        self.cap          = cap
+        self.jitter       = jitter
+        self.max_attempts = max_attempts
+
+    def delay(self, attempts: int, retry_after: float | None = None) -> float:
+        d = min(self.cap, self.base * self.factor ** max(0, attempts - 1))
+        d *= 1 + random.uniform(-self.jitter, self.jitter)
+        return max(d, retry_after or 0.0)
+
+
+class RetryQueue:
+    """
+    Persistent failed-key queue: key → {attempts, next_at, error}.
+    Keys not in the queue are always due; queued keys are due once their
+    backoff has expired, until max_attempts is reached (then exhausted).
+    A permanent failure (a 404 and other non-transient 4xx) is exhausted
+    straight away; only --retry-failed (force) tries it again.
+    """
+
+    def __init__(self, path: Path, policy: RetryPolicy | None = None, force: bool = False):
+        self.path   = path
+        self.policy = policy or RetryPolicy()
+        self.force  = force   # ignore backoff and max_attempts (--retry-failed)
+        self.items: dict[str, dict] = {}
+        if path.exists():
+            try:
+                self.items = json.loads(path.read_text(encoding="utf-8"))
+            except ValueError:
+                self.items = {}
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.items
+
+    def exhausted(self, key: str) -> bool:
+        item = self.items.get(key)
+        return bool(item) and not self.force and item["attempts"] >= self.policy.max_attempts
+
+    def due(self, key: str, now: float | None = None) -> bool:
+        item = self.items.get(key)
+        if item is None or self.force:
+            return True
+        if self.exhausted(key):
+            return False
+        return item["next_at"] <= (time.time() if now is None else now)
+
+    def fail(
+        self, key: str, error: str, retry_after: float | None = None, permanent: bool = False
+    ) -> None:
+        item = self.items.setdefault(key, {"attempts": 0})
+        item["attempts"] += 1
+        item["error"]    = error
+        item["next_at"]  = time.time() + self.policy.delay(item["attempts"], retry_after)
+        if permanent:
+            item["attempts"] = max(item["attempts"], self.policy.max_attempts)
+            item["permanent"] = True
+
+    def done(self, key: str) -> None:
+        self.items.pop(key, None)
+
+    def counts(self) -> tuple[int, int, int]:
+        """(due now, waiting on backoff, exhausted)."""
+        now = time.time()
+        exhausted = sum(1 for k in self.items if self.exhausted(k))
+        due = sum(1 for k in self.items if not self.exhausted(k) and self.due(k, now))
+        return due, len(self.items) - due - exhausted, exhausted
+
+    def save(self) -> None:
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.items, indent=1), encoding="utf-8")
+        os.replace(tmp, self.path)
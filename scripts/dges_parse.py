@@ -0,0 +1,364 @@
+"""
+DGES detail page parser (detcursopi.asp)
+========================================
+Shared by scrape_dges.py and import_supabase.py. Extracts in one pass:
+  - distrito (from the Endereço postal code line)
+  - tipo (Privado in Características → privada)
+  - provas de ingresso   [{conjunto_id, code, name}, ...]
+  - classificações mínimas (candidatura / provas de ingresso)
+  - fórmula de cálculo (peso_secundario / peso_exames)
+  - Dados Estatísticos: vagas_<ano>_f<fase> and nota_<ano>_f<fase> (0-200)
+
+Both paths read the page the same way:
+  - a section is everything after its <h2> up to the next <h2> or the end
+    of the element that contains the <h2> (the heading's following siblings);
+  - when two headings have the same title, the later one's section wins;
+  - a fragment lookup ("Dados Estat") takes the first title containing it;
+  - nota_<ano>_f<fase> comes from the stats table's "Último Colocado"
+    row(s). The two scripts this replaced disagreed when a page has more
+    than one such row, and each keeps its own rule: scrape_dges takes the
+    FIRST row (parse_detail, nota_row="first"); import_supabase lets each
+    later row's non-empty cells overwrite (nota_row="last", via
+    parse_detail_last_row).
+
+Fast path: one regex scan splits the page at its <h2> headings (the
+extract_section approach from database/scrape_provas.py) and a single
+HTMLParser state machine pass over each section body collects its text and
+first table, stopping at the end tag that closes the heading's container —
+no tree is built. Pages whose layout the fast path does not recognise fall
+back to the BeautifulSoup tree parser; the result's "_parser" field says
+which one ran ("fast" / "tree") so callers can count fallbacks, even for
+memoized results. scripts/bench/bench_parse.py --check runs both paths over
+the corpus and fails if they disagree.
+
+Bump PARSER_VERSION whenever the output of parse_detail changes.
+"""
+
+import html as _html
+import re
+from html.parser import HTMLParser
+
+PARSER_VERSION = 3
+
+_H2_RE      = re.compile(r"<h2[^>]*>(.*?)</h2\s*>", re.DOTALL | re.IGNORECASE)
+_SEC_END_RE = re.compile(r"<h2[\s>]|</body", re.IGNORECASE)
+_VOID_TAGS  = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input",
+    "link", "meta", "source", "track", "wbr",
+}
+_TAG_RE     = re.compile(r"<[^>]+>")
+_CHARSET_RE = re.compile(rb"""<meta[^>]+charset=["']?([\w-]+)""", re.IGNORECASE)
+
+_DISTRITO_RE = re.compile(
+    r"\d{4}-\d{3}\s+([A-ZÁÉÍÓÚÂÊÔÃÕÀÇ][A-ZÁÉÍÓÚÂÊÔÃÕÀÇ a-záéíóúâêôãõàç]{2,40}?)"
+    r"(?:\s*\bMap|\s*\bTel|\s*<|\s*$)"
+)
+
+# ── Value helpers ─────────────────────────────────────────────────────────────
+
+def _to_float(v) -> float | None:
+    if v is None:
+        return None
+    try:
+        s = str(v).strip().replace(",", ".")
+        f = float(re.sub(r"[^\d.]", "", s))
+        return f if f > 0 else None
+    except Exception:
+        return None
+
+def _to_int(v) -> int | None:
+    try:
+        return int(float(str(v).strip()))
+    except (TypeError, ValueError):
+        return None
+
+# ── Field extraction (shared by both paths) ───────────────────────────────────
+
+def _extract(
+    sec_text, provas_text: str, stats_rows: list[list[str]], nota_row: str = "first"
+) -> dict:
+    """
+    sec_text(fragment) → flattened text of the first section whose title
+    contains fragment; provas_text keeps <br> as newlines; stats_rows are the
+    cell texts of the Dados Estatísticos table; nota_row is "first" or "last"
+    (see the module docstring).
+    """
+    detail: dict = {}
+
+    # ── District ──────────────────────────────────────────────────────────────
+    m = _DISTRITO_RE.search(sec_text("Endere"))
+    if m:
+        detail["distrito"] = m.group(1).strip().title()
+
+    # ── Tipo from características (HTML is ground truth for private schools) ──
+    detail["tipo"] = "privada" if "Privado" in sec_text("Caracter") else "publica"
+
+    # ── Provas de ingresso ────────────────────────────────────────────────────
+    provas: list[dict] = []
+    conjunto_id = 1
+    for line in provas_text.splitlines():
+        clean = line.replace("\xa0", " ").strip()
+        if not clean or clean.lower().startswith("um dos"):
+            continue
+        if re.fullmatch(r"ou", clean, re.IGNORECASE):
+            conjunto_id += 1
+            continue
+        m2 = re.match(r"^(\d{2})\s+(.+)$", clean)
+        if m2:
+            provas.append({
+                "conjunto_id": conjunto_id,
+                "code":        m2.group(1),
+                "name":        m2.group(2).strip(),
+            })
+    detail["provas"] = provas
+
+    # ── Classificações mínimas ────────────────────────────────────────────────
+    cmin = sec_text("Classif")
+    m = re.search(r"candidatura:\s*(\d+(?:[.,]\d)?)\s*pontos?", cmin)
+    if m:
+        detail["nota_minima_candidatura"] = float(m.group(1).replace(",", "."))
+    m = re.search(r"[Pp]rovas? de ingresso:\s*(\d+(?:[.,]\d)?)\s*pontos?", cmin)
+    if m:
+        detail["nota_minima_prova"] = float(m.group(1).replace(",", "."))
+
+    # ── Fórmula ───────────────────────────────────────────────────────────────
+    formula = sec_text("rmula")
+    m = re.search(r"secund[aá]rio:\s*(\d+)\s*%", formula)
+    if m:
+        detail["peso_secundario"] = int(m.group(1)) / 100
+    m = re.search(r"[Pp]rovas? de ingresso:\s*(\d+)\s*%", formula)
+    if m:
+        detail["peso_exames"] = int(m.group(1)) / 100
+
+    # ── Dados Estatísticos: vagas + nota último colocado (0-200) ─────────────
+    if len(stats_rows) >= 3:
+        col_map: dict[int, tuple[int, int]] = {}
+        col_idx = 1
+        for yc in stats_rows[0][1:]:
+            if re.match(r"\d{4}", yc):
+                yr = int(yc)
+                for fase in (1, 2):
+                    col_map[col_idx] = (yr, fase)
+                    col_idx += 1
+        nota_seen = False
+        for cells in stats_rows[2:]:
+            if not cells:
+                continue
+            label = cells[0]
+            if label == "Vagas":
+                for ci, (yr, fase) in col_map.items():
+                    if ci < len(cells) and cells[ci]:
+                        v = _to_int(cells[ci])
+                        if v is not None:
+                            detail[f"vagas_{yr}_f{fase}"] = v
+            if "ltimo Colocado" in label or "ltimo colocado" in label:
+                if nota_seen and nota_row == "first":
+                    continue
+                nota_seen = True
+                for ci, (yr, fase) in col_map.items():
+                    if ci < len(cells) and cells[ci]:
+                        v = _to_float(cells[ci])
+                        if v is not None:
+                            detail[f"nota_{yr}_f{fase}"] = v
+
+    return detail
+
+# ── Fast path: regex section split + one HTMLParser pass ─────────────────────
+
+class _SectionScanner(HTMLParser):
+    """
+    Text (with <br> → newline) and first-table cells of one section body.
+    An end tag with no open element to close is the end of the heading's
+    container: everything after it is ignored, as it is not a sibling of
+    the heading.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: list[str] = []
+        self.rows: list[list[str]] = []
+        self.tables = 0
+        self.nested = False
+        self.done   = False
+        self._open: list[str] = []
+        self._depth = 0
+        self._cell: list[str] | None = None
+        self._skip = 0
+
+    def _close_cell(self):
+        if self._cell is not None and self.rows:
+            self.rows[-1].append("".join(s.strip() for s in self._cell))
+        self._cell = None
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if tag not in _VOID_TAGS:
+            self._open.append(tag)
+        if tag == "br":
+            self.parts.append("\n")
+        elif tag in ("script", "style"):
+            self._skip += 1
+        elif tag == "table":
+            self._depth += 1
+            self.tables += 1
+            self.nested = self.nested or self._depth > 1
+        elif self.tables == 1 and self._depth == 1:
+            if tag == "tr":
+                self._close_cell()
+                self.rows.append([])
+            elif tag in ("td", "th"):
+                self._close_cell()
+                if self.rows:
+                    self._cell = []
+
+    def handle_endtag(self, tag):
+        if self.done or tag in _VOID_TAGS:
+            return
+        if tag not in self._open:
+            if tag == "p":
+                return   # stray </p>: lxml inserts an empty <p>, not a container end
+            self._close_cell()
+            self.done = True
+            return
+        # Close it together with any elements left open inside it
+        while self._open.pop() != tag:
+            pass
+        if tag in ("script", "style"):
+            self._skip = max(0, self._skip - 1)
+        elif tag == "table":
+            self._close_cell()
+            self._depth = max(0, self._depth - 1)
+        elif tag in ("td", "th", "tr"):
+            self._close_cell()
+
+    def handle_data(self, data: str):
+        if self._skip or self.done:
+            return
+        self.parts.append(data)
+        if self._cell is not None:
+            self._cell.append(data)
+
+
+def _decode(raw: bytes) -> str:
+    m = _CHARSET_RE.search(raw[:2048])
+    if m:
+        try:
+            return raw.decode(m.group(1).decode("ascii"), errors="replace")
+        except LookupError:
+            pass
+    try:
+        return raw.decode("utf-8")
+    except UnicodeDecodeError:
+        return raw.decode("iso-8859-1")
+
+
+def _parse_fast(raw: bytes, nota_row: str = "first") -> dict | None:
+    """None when the layout is unusual and the tree parser should run instead."""
+    page = _decode(raw)
+    heads = list(_H2_RE.finditer(page))
+    if not heads:
+        return None
+
+    sections: dict[str, _SectionScanner] = {}
+    for h in heads:
+        title = _html.unescape(_TAG_RE.sub("", h.group(1))).strip()
+        end = _SEC_END_RE.search(page, h.end())
+        body = page[h.end() : end.start() if end else len(page)]
+        scanner = _SectionScanner()
+        scanner.feed(body)
+        scanner.close()
+        sections[title] = scanner   # a repeated title: the later section wins, as in _parse_tree
+
+    def find(fragment: str) -> _SectionScanner | None:
+        for title, sc in sections.items():
+            if fragment.lower() in title.lower():
+                return sc
+        return None
+
+    provas = find("Provas de Ingresso")
+    stats  = find("Dados Estat")
+    if provas is None or (stats is not None and stats.nested):
+        return None
+
+    def sec_text(fragment: str) -> str:
+        sc = find(fragment)
+        if sc is None:
+            return ""
+        return " ".join(s.strip() for s in sc.parts if s.strip())
+
+    detail = _extract(
+        sec_text,
+        "".join(provas.parts),
+        stats.rows if stats is not None else [],
+        nota_row,
+    )
+    detail["_parser"] = "fast"
+    return detail
+
+# ── Fallback: BeautifulSoup tree parser ───────────────────────────────────────
+
+def _parse_tree(raw: bytes, nota_row: str = "first") -> dict:
+    from bs4 import BeautifulSoup
+
+    try:
+        soup = BeautifulSoup(raw, "lxml")
+    except Exception:
+        return {}
+
+    sections: dict[str, list] = {}
+    for h2 in soup.find_all("h2"):
+        siblings = []
+        for sib in h2.next_siblings:
+            if getattr(sib, "name", None) == "h2":
+                break
+            siblings.append(sib)
+        sections[h2.get_text(strip=True)] = siblings
+
+    def sec_nodes(fragment: str) -> list:
+        for k, v in sections.items():
+            if fragment.lower() in k.lower():
+                return v
+        return []
+
+    def sec_text(fragment: str) -> str:
+        return " ".join(
+            n.get_text(" ", strip=True) if hasattr(n, "get_text") else str(n).strip()
+            for n in sec_nodes(fragment)
+        ).strip()
+
+    provas_text = ""
+    provas_nodes = sec_nodes("Provas de Ingresso")
+    if provas_nodes:
+        frag = BeautifulSoup("".join(str(n) for n in provas_nodes), "lxml")
+        for br in frag.find_all("br"):
+            br.replace_with("\n")
+        provas_text = frag.get_text()
+
+    stats_rows: list[list[str]] = []
+    stats_nodes = sec_nodes("Dados Estat")
+    if stats_nodes:
+        table = BeautifulSoup("".join(str(n) for n in stats_nodes), "lxml").find("table")
+        if table:
+            stats_rows = [
+                [td.get_text(strip=True) for td in tr.find_all(["td", "th"])]
+                for tr in table.find_all("tr")
+            ]
+
+    detail = _extract(sec_text, provas_text, stats_rows, nota_row)
+    detail["_parser"] = "tree"
+    return detail
+
+# ── Entry point ───────────────────────────────────────────────────────────────
+
+def parse_detail(raw: bytes, nota_row: str = "first") -> dict:
+    """Parse a DGES detail page. Returns extracted fields."""
+    if nota_row not in ("first", "last"):
+        raise ValueError(f"nota_row must be 'first' or 'last', not {nota_row!r}")
+    return _parse_fast(raw, nota_row) or _parse_tree(raw, nota_row)
+
+def parse_detail_last_row(raw: bytes) -> dict:
+    """parse_detail(raw, nota_row="last") — import_supabase's row rule, as a
+    module-level function memo_parse_many can hand to worker processes.
+    Memoize it under its own parser name ("dges_parse:last")."""
+    return parse_detail(raw, nota_row="last")
@@ -0,0 +1,117 @@
+"""
+Streaming, column-projected workbook reader
+===========================================
+Shared by scrape_dges.py and import_supabase.py. Instead of materialising
+every row of every column as a dict, the loaders name the columns they use:
+
+    PARES_COLUMNS = {"curso": "CURSO", "cod_uo": "COD UO", ...}
+    for r in xlsx_rows(PARES_FILE, "PUB_PRIV26272", PARES_COLUMNS):
+        r.curso, r.cod_uo
+
+Column indices are resolved once from the header row, openpyxl is asked only
+for cells up to the right-most needed column, and rows are yielded one at a
+time as namedtuples (fields = the mapping's keys). A header missing from the
+sheet yields None in that field, like dict.get did.
+
+load_rows() is the list form with a snapshot cache: the projected rows are
+pickled to <snapshot_dir>/<workbook>.<projection hash>.pkl together with the
+workbook's path, size and mtime, and served from there until the workbook
+changes — no openpyxl import or XML parsing on a warm start. Bump
+SNAPSHOT_VERSION whenever the reader's output changes.
+"""
+
+import hashlib
+import os
+import pickle
+from collections import namedtuple
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterator
+
+SNAPSHOT_VERSION = 1
+
+
+def _rebuild(fields: tuple[str, ...], values: tuple) -> tuple:
+    return _row_type(fields)._make(values)
+
+
+@lru_cache(maxsize=None)
+def _row_type(fields: tuple[str, ...]) -> type:
+    # Pickles as (fields, values) so rows can come back from worker processes,
+    # which define their own Row classes.
+    def __reduce__(self):
+        return _rebuild, (self._fields, tuple(self))
+
+    return type("Row", (namedtuple("Row", fields),), {"__slots__": (), "__reduce__": __reduce__})
+
+
+def row_type(columns: dict[str, str]) -> type:
+    """The namedtuple class xlsx_rows yields for `columns`."""
+    return _row_type(tuple(columns))
+
+
+def xlsx_rows(
+    path: Path,
+    sheet: str,
+    columns: dict[str, str],
+    header_row: int = 0,
+) -> Iterator[tuple]:
+    """
+    Yield one namedtuple per non-empty data row of `sheet`, projected to
+    `columns` (field name → header text). `header_row` is 0-based.
+    """
+    import openpyxl
+
+    Row = row_type(columns)
+    wb = openpyxl.load_workbook(str(path), data_only=True, read_only=True)
+    try:
+        ws = wb[sheet]
+        headers = next(ws.iter_rows(
+            min_row=header_row + 1, max_row=header_row + 1, values_only=True
+        ), None)
+        if headers is None:
+            return
+        pos = {h: i for i, h in enumerate(headers)}   # last duplicate wins, as dict(zip()) did
+        idx = [pos.get(h) for h in columns.values()]
+        width = max((i for i in idx if i is not None), default=0) + 1
+        for r in ws.iter_rows(min_row=header_row + 2, max_col=width, values_only=True):
+            vals = [r[i] if i is not None and i < len(r) else None for i in idx]
+            if any(v is not None for v in vals):
+                yield Row(*vals)
+    finally:
+        wb.close()
+
+
+def load_rows(
+    path: Path,
+    sheet: str,
+    columns: dict[str, str],
+    header_row: int = 0,
+    snapshot_dir: Path | None = None,
+) -> list[tuple]:
+    """list(xlsx_rows(...)), from the snapshot in `snapshot_dir` while it is fresh."""
+    if snapshot_dir is None:
+        return list(xlsx_rows(path, sheet, columns, header_row))
+
+    Row  = row_type(columns)
+    proj = (sheet, header_row, tuple(columns.items()))
+    st   = path.stat()
+    key  = (SNAPSHOT_VERSION, str(path.resolve()), st.st_size, st.st_mtime_ns, proj)
+    name = hashlib.blake2b(repr(proj).encode(), digest_size=6).hexdigest()
+    snap = snapshot_dir / f"{path.stem}.{name}.pkl"
+
+    try:
+        with open(snap, "rb") as f:
+            data = pickle.load(f)
+        if data["key"] == key:
+            return list(map(Row._make, data["rows"]))
+    except Exception:   # missing, truncated or from another layout — rebuild it
+        pass
+
+    rows = list(xlsx_rows(path, sheet, columns, header_row))
+    snapshot_dir.mkdir(parents=True, exist_ok=True)
+    tmp = snap.with_suffix(".tmp")
+    with open(tmp, "wb") as f:
+        pickle.dump({"key": key, "rows": [tuple(r) for r in rows]}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, snap)
+    return rows
@@ -4,11 +4,18 @@ DGES Course Data Builder
 ========================
 1. Loads the authoritative 2026/27 course list from dados_dges/ (official DGES files).
 2. Fetches each course's detail page from www.dges.gov.pt for provas, pesos,
-   notas mínimas, district, and historical cutoffs (cached in ./cache/).
+   notas mínimas, district, and historical cutoffs (cached in ./cache/pages.sqlite).
+   Missing pages are prefetched concurrently (CONCURRENCY in flight). The
+   request rate adapts to dges.gov.pt's latency and 429/5xx answers, starting
+   at RATE and never above MAX_RATE requests/second (see dges_fetch.py);
+   every attempt — retries and redirect hops included — takes a token.
 3. Merges everything and writes dges_cursos_completo.xlsx:
      Sheet "Cursos"           — one row per course, all fields
      Sheet "Provas (detalhe)" — one row per exam requirement
      Sheet "Histórico"        — one row per (course, year, fase) grade entry
+   (streamed through a write-only workbook, styled as rows are written), or
+   with --format csv|parquet one unstyled file per sheet:
+     dges_cursos_completo.{cursos,provas,historico}.{csv,parquet}
 
 Sources of truth (in priority order for each field):
   - Nota último colocado 2025 (1ª fase) → iesip_vagas_2026-2027_nota_ultimo_colocado_*
@@ -23,31 +30,98 @@ Usage:
     pip install -r requirements.txt
     python scrape_dges.py
 
+    python scrape_dges.py --refresh   # revalidate cached pages (conditional GET)
+    python scrape_dges.py --workers 4 # parse pages on 4 processes
+    python scrape_dges.py --retry-failed  # retry failed pages now, ignoring backoff
+    python scrape_dges.py --format csv    # or parquet — plain files for machine consumers
+
 Re-run freely — cached HTML pages are not re-fetched.
+Pages live compressed in one packed store (see dges_cache.py) together with
+their ETag / Last-Modified / fetch time. --refresh revalidates pages older
+than REFRESH_MAX_AGE with If-None-Match / If-Modified-Since: a 304 keeps the
+cached body, so a nightly refresh is mostly header-only traffic.
+Pages that fail after MAX_RETRY attempts with a timeout, 429 or 5xx go into
+./cache/retry.json with exponential backoff (see dges_fetch.RetryQueue) and
+are only retried by a later run once their backoff has expired. A 404 or
+other 4xx is recorded there as permanent (no retries; --retry-failed
+forces one).
 Delete ./cache/ to force a full refresh.
 """
 
+import csv
+import importlib.util
 import io
 import logging
-import re
+import sys
 import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from urllib.parse import urljoin
 
-import openpyxl
 import requests
-from bs4 import BeautifulSoup
 from openpyxl.styles import Alignment, Font, PatternFill
+from openpyxl.utils import get_column_letter
+
+from dges_cache import PageStore, cache_key
+from dges_fetch import (
+    AdaptiveRate, RetryQueue, TokenBucket, fetch_all, parse_retry_after, transient,
+)
+from dges_parse import PARSER_VERSION, parse_detail
+from dges_xlsx import load_rows
 
 # ── Config ────────────────────────────────────────────────────────────────────
 
+USAGE = (
+    "usage: scrape_dges.py [--refresh] [--workers N] [--retry-failed] "
+    "[--format xlsx|csv|parquet]"
+)
+
+def _arg(flag: str, default, cast=str):
+    """The value after `flag` in sys.argv, or `default` when the flag is absent.
+    A missing or invalid value exits with USAGE."""
+    if flag not in sys.argv:
+        return default
+    try:
+        return cast(sys.argv[sys.argv.index(flag) + 1])
+    except (IndexError, ValueError):
+        sys.exit(f"{flag}: missing or invalid value\n{USAGE}")
+
+def _count(v: str) -> int:
+    n = int(v)
+    if n < 1:
+        raise ValueError(v)
+    return n
+
+def _choice(*options: str):
+    def cast(v: str) -> str:
+        if v not in options:
+            raise ValueError(v)
+        return v
+    return cast
+
 SCRIPT_DIR = Path(__file__).parent
 ROOT_DIR   = SCRIPT_DIR.parent
 DATA_DIR   = ROOT_DIR / "dados_dges"
 CACHE_DIR  = SCRIPT_DIR / "cache"
+SNAPSHOT_DIR = CACHE_DIR / "xlsx"   # projected workbook rows, keyed by size + mtime
 OUTPUT     = SCRIPT_DIR / "dges_cursos_completo.xlsx"
 
-DELAY     = 0.4
-MAX_RETRY = 3
+MAX_RETRY   = 3
+MAX_REDIRECTS = 5
+CONCURRENCY = 6      # detail pages in flight during prefetch
+RATE        = 1.0    # starting requests/second; adapts between 0.2 and MAX_RATE
+MAX_RATE    = 2.5    # agreed ceiling — never exceeded (≙ the old 0.4 s delay)
+REFRESH     = "--refresh" in sys.argv
+REFRESH_MAX_AGE = 12 * 3600   # --refresh revalidates pages fetched longer ago (s)
+WORKERS = _arg("--workers", 1, _count)
+FORMAT  = _arg("--format", "xlsx", _choice("xlsx", "csv", "parquet"))
+
+# Parquet goes through pandas and a parquet engine — fail now, not after the scrape
+if FORMAT == "parquet" and (
+    importlib.util.find_spec("pandas") is None
+    or not any(importlib.util.find_spec(m) for m in ("pyarrow", "fastparquet"))
+):
+    sys.exit("--format parquet needs pandas and pyarrow: pip install -r requirements.txt")
 
 PARES_FILE    = DATA_DIR / "iesip_vagas_2026-2027_pares_ies_cursos_16.02.2026v2_.xlsx"
 NOTA_FILE     = DATA_DIR / "iesip_vagas_2026-2027_nota_ultimo_colocado_1afase_2025_16.02.2026_.xlsx"
@@ -55,7 +129,10 @@ NOTA2024_FILE = DATA_DIR / "dges_vagascna_nota_ult_colocado_1afase2024_2025_17.0
 
 DETAIL_URL = "https://www.dges.gov.pt/guias/detcursopi.asp?codc={codc}&code={code}"
 
-CACHE_DIR.mkdir(exist_ok=True)
+STORE: PageStore | None = None   # opened in main() (the benchmarks set their own)
+RETRY = RetryQueue(CACHE_DIR / "retry.json", force="--retry-failed" in sys.argv)
+CONTROL = AdaptiveRate(start=RATE, ceiling=MAX_RATE)
+BUCKET  = TokenBucket(CONTROL)   # one token per request sent, shared by all threads
 
 logging.basicConfig(
     level=logging.INFO,
@@ -117,112 +194,208 @@ def _i(v) -> int | None:
     f = _f(v)
     return None if f is None else int(f)
 
-def _to_float(v) -> float | None:
-    if v is None:
-        return None
-    try:
-        s = str(v).strip().replace(",", ".")
-        f = float(re.sub(r"[^\d.]", "", s))
-        return f if f > 0 else None
-    except Exception:
-        return None
-
 # ── HTTP fetch with cache ─────────────────────────────────────────────────────
 
-def _cache_key(url: str) -> str:
-    return re.sub(r"[^\w]", "_", url)[:180]
+def _fetch(url: str, conditional: bool = False) -> int:
+    """
+    GET with retries into the store; returns the HTTP status (200 or 304).
+
+    With `conditional`, the stored validators are sent and a 304 only bumps
+    the fetch time — the cached body is kept as is.
+    """
+    key  = cache_key(url)
+    meta = STORE.meta(key) if conditional else {}
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
 
-def fetch_cached(url: str) -> bytes:
-    path = CACHE_DIR / _cache_key(url)
-    if path.exists():
-        return path.read_bytes()
     for attempt in range(MAX_RETRY):
         try:
-            r = SESSION.get(url, timeout=30)
+            r = _get(url, headers)
             r.raise_for_status()
-            path.write_bytes(r.content)
-            time.sleep(DELAY)
-            return r.content
+            if r.status_code == 304:
+                STORE.touch(key)
+            else:
+                STORE.put(
+                    key,
+                    r.content,
+                    etag=r.headers.get("ETag"),
+                    last_modified=r.headers.get("Last-Modified"),
+                )
+            return r.status_code
         except Exception as exc:
-            if attempt == MAX_RETRY - 1:
+            if attempt == MAX_RETRY - 1 or not transient(_status(exc)):
                 raise
-            time.sleep(2 ** attempt)
+            time.sleep(min(60, max(2 ** attempt, _retry_after(exc) or 0)))
+
+def _get(url: str, headers: dict) -> requests.Response:
+    """
+    One GET through BUCKET. Redirects are followed by hand so each hop
+    takes its own token and reports to CONTROL like any other request.
+    """
+    for _hop in range(MAX_REDIRECTS + 1):
+        BUCKET.take()
+        t0 = time.monotonic()
+        try:
+            r = SESSION.get(url, headers=headers, timeout=30, allow_redirects=False)
+        except requests.RequestException:
+            CONTROL.observe(time.monotonic() - t0, None)   # timeout / network error
+            raise
+        CONTROL.observe(time.monotonic() - t0, r.status_code)
+        if not r.is_redirect:
+            return r
+        url = urljoin(url, r.headers["Location"])
+    raise requests.TooManyRedirects(f"more than {MAX_REDIRECTS} redirects", response=r)
+
+def _status(exc: Exception) -> int | None:
+    resp = getattr(exc, "response", None)
+    return resp.status_code if resp is not None else None
+
+def _retry_after(exc: Exception) -> float | None:
+    resp = getattr(exc, "response", None)
+    return parse_retry_after(resp.headers.get("Retry-After")) if resp is not None else None
+
+def _record(url: str, res) -> None:
+    """
+    Move a fetch outcome into the retry queue (failure) or out of it
+    (success). Timeouts, 429 and 5xx are retried by later runs; a 404 or
+    other 4xx is recorded as permanent and not fetched again.
+    """
+    if isinstance(res, Exception):
+        RETRY.fail(
+            url, f"{type(res).__name__}: {res}"[:200], _retry_after(res),
+            permanent=not transient(_status(res)),
+        )
+    else:
+        RETRY.done(url)
 
-# ── Excel loaders ─────────────────────────────────────────────────────────────
+def fetch_cached(url: str) -> bytes:
+    raw = STORE.get(cache_key(url))
+    if raw is not None:
+        return raw
+    if not RETRY.due(url):
+        raise RuntimeError("failed earlier — waiting on retry backoff")
+    try:
+        _fetch(url)
+    except Exception as exc:
+        _record(url, exc)
+        raise
+    _record(url, None)
+    return STORE.get(cache_key(url))
+
+def _is_stale(url: str) -> bool:
+    return time.time() - (STORE.meta(cache_key(url)).get("fetched_at") or 0) > REFRESH_MAX_AGE
+
+def prefetch(urls: list[str]) -> None:
+    """
+    Fill the cache for every uncached URL, CONCURRENCY at a time.
+    With --refresh, stale cached pages are revalidated in the same pass; a
+    revalidation that fails keeps the cached body and stays out of the retry
+    queue (the next --refresh tries it again).
+    """
+    keys    = STORE.keys()
+    cached  = {u for u in urls if cache_key(u) in keys}
+    missing = [u for u in urls if u not in cached and RETRY.due(u)]
+    stale   = [u for u in urls if u in cached and _is_stale(u)] if REFRESH else []
+    todo    = missing + stale
+    due, waiting, exhausted = RETRY.counts()
+    if waiting or exhausted:
+        log.info("  Retry queue: %d waiting on backoff, %d given up (--retry-failed to force).",
+                 waiting, exhausted)
+    if not todo:
+        return
+    log.info("  Prefetching %d uncached + revalidating %d pages (%d in flight, ≤%.1f req/s)...",
+             len(missing), len(stale), CONCURRENCY, MAX_RATE)
+    stale_set = set(stale)
+    done = failed = not_modified = kept = 0
+
+    def on_result(url: str, res) -> None:
+        nonlocal done, failed, not_modified, kept
+        done += 1
+        if isinstance(res, Exception) and url in stale_set:
+            kept += 1
+            RETRY.done(url)   # the cached body is still good — nothing to retry
+            log.warning("  Revalidation failed %s — %s; keeping the cached copy", url, res)
+        else:
+            _record(url, res)
+            if isinstance(res, Exception):
+                failed += 1
+                log.debug("  Fetch failed %s — %s", url, res)
+            elif res == 304:
+                not_modified += 1
+        if done % 100 == 0 or done == len(todo):
+            log.info("  fetched %d / %d  (304: %d, failed: %d, kept cached: %d)  rate %s",
+                     done, len(todo), not_modified, failed, kept, CONTROL)
+
+    fetch_all(
+        todo,
+        lambda u: _fetch(u, conditional=u in stale_set),
+        concurrency=CONCURRENCY,
+        rate=None,   # _fetch takes a BUCKET token per attempt
+        on_result=on_result,
+    )
+    RETRY.save()
 
-def _xlsx_rows(path: Path, sheet: str, header_row: int = 0) -> list[dict]:
-    wb = openpyxl.load_workbook(str(path), data_only=True, read_only=True)
-    ws = wb[sheet]
-    rows = list(ws.iter_rows(values_only=True))
-    wb.close()
-    if len(rows) <= header_row:
-        return []
-    headers = rows[header_row]
-    return [
-        dict(zip(headers, r))
-        for r in rows[header_row + 1:]
-        if any(v is not None for v in r)
-    ]
+# ── Excel loaders ─────────────────────────────────────────────────────────────
 
-def load_pares() -> list[dict]:
-    rows = _xlsx_rows(PARES_FILE, "PUB_PRIV26272", header_row=0)
+PARES_COLUMNS = {
+    "subsistema": "SUBSISTEMA",
+    "cod_ies":    "COD IES",
+    "cod_uo":     "COD UO",
+    "ies_uo":     "IES UO",
+    "curso":      "CURSO",
+    "cod_curso":  "COD CURSO",
+    "tipo_curso": "TIPO CURSO",
+    "cod_cnaef":  "COD CNAEF",
+    "vagas":      "REGIME GERAL DE ACESSO",
+}
+NOTAS_2025_COLUMNS = {
+    "cod_uo":    "COD UO",
+    "cod_curso": "COD CURSO",
+    "nota":      "NOTA ULTIMO COLOCADO REGIME GERAL DE ACESSO 2025/2026",
+}
+NOTAS_2024_COLUMNS = {
+    "cod_inst":  "Código Instit.",
+    "cod_curso": "Código Curso",
+    "nota":      "Nota último colocado 1ª Fase 2024 (cont. geral)",
+}
+
+def load_pares() -> list[tuple]:
+    rows = load_rows(
+        PARES_FILE, "PUB_PRIV26272", PARES_COLUMNS, header_row=0, snapshot_dir=SNAPSHOT_DIR
+    )
     log.info("Pares: %d courses.", len(rows))
     return rows
 
 def load_notas_2025() -> dict[tuple[str, str], float]:
-    col = "NOTA ULTIMO COLOCADO REGIME GERAL DE ACESSO 2025/2026"
-    rows = _xlsx_rows(NOTA_FILE, "Concurso Nacional", header_row=0)
     out: dict[tuple[str, str], float] = {}
-    for r in rows:
-        uo    = _s(r.get("COD UO"))
-        curso = _s(r.get("COD CURSO"))
-        nota  = _f(r.get(col))
+    for r in load_rows(
+        NOTA_FILE, "Concurso Nacional", NOTAS_2025_COLUMNS, header_row=0, snapshot_dir=SNAPSHOT_DIR
+    ):
+        uo    = _s(r.cod_uo)
+        curso = _s(r.cod_curso)
+        nota  = _f(r.nota)
         if uo and curso and nota is not None:
             out[(uo, curso)] = nota
     log.info("Notas 2025: %d entries.", len(out))
     return out
 
 def load_notas_2024() -> dict[tuple[str, str], float]:
-    col = "Nota último colocado 1ª Fase 2024 (cont. geral)"
-    rows = _xlsx_rows(NOTA2024_FILE, "Nacional", header_row=3)
     out: dict[tuple[str, str], float] = {}
-    for r in rows:
-        inst  = _s(r.get("Código Instit."))
-        curso = _s(r.get("Código Curso"))
-        nota  = _f(r.get(col))
+    for r in load_rows(
+        NOTA2024_FILE, "Nacional", NOTAS_2024_COLUMNS, header_row=3, snapshot_dir=SNAPSHOT_DIR
+    ):
+        inst  = _s(r.cod_inst)
+        curso = _s(r.cod_curso)
+        nota  = _f(r.nota)
         if inst and curso and nota is not None:
             out[(inst, curso)] = nota
     log.info("Notas 2024: %d entries.", len(out))
     return out
 
-# ── HTML parser ───────────────────────────────────────────────────────────────
-
-def _sections(soup: BeautifulSoup) -> dict[str, list]:
-    out: dict[str, list] = {}
-    for h2 in soup.find_all("h2"):
-        title = h2.get_text(strip=True)
-        siblings = []
-        for sib in h2.next_siblings:
-            if getattr(sib, "name", None) == "h2":
-                break
-            siblings.append(sib)
-        out[title] = siblings
-    return out
-
-def _sec_text(sections: dict, fragment: str) -> str:
-    for k, v in sections.items():
-        if fragment.lower() in k.lower():
-            return " ".join(
-                n.get_text(" ", strip=True) if hasattr(n, "get_text") else str(n).strip()
-                for n in v
-            ).strip()
-    return ""
-
-def _sec_nodes(sections: dict, fragment: str) -> list:
-    for k, v in sections.items():
-        if fragment.lower() in k.lower():
-            return v
-    return []
+# ── Detail pages (parsed by dges_parse) ───────────────────────────────────────
 
 def scrape_detail(cod_curso: str, cod_uo: str) -> dict:
     url = DETAIL_URL.format(codc=cod_curso, code=cod_uo)
@@ -231,112 +404,31 @@ def scrape_detail(cod_curso: str, cod_uo: str) -> dict:
     except Exception as exc:
         log.debug("  Skip %s/%s — %s", cod_uo, cod_curso, exc)
         return {}
-
-    try:
-        soup = BeautifulSoup(raw, "lxml")
-    except Exception:
-        return {}
-
-    sections = _sections(soup)
-    detail: dict = {}
-
-    # ── District ──────────────────────────────────────────────────────────────
-    addr = _sec_text(sections, "Endere")
-    m = re.search(
-        r"\d{4}-\d{3}\s+([A-ZÁÉÍÓÚÂÊÔÃÕÀÇ][A-ZÁÉÍÓÚÂÊÔÃÕÀÇ a-záéíóúâêôãõàç]{2,40}?)"
-        r"(?:\s*\bMap|\s*\bTel|\s*<|\s*$)",
-        addr,
+    return STORE.memo_parse(raw, "dges_parse", PARSER_VERSION, parse_detail)
+
+def scrape_details(pairs: list[tuple[str, str] | None]) -> list[dict]:
+    """
+    scrape_detail for many (cod_curso, cod_uo) pairs, in order (None → {}).
+    Pages are read one by one; memo misses are parsed on WORKERS processes.
+    """
+    raws: list[bytes | None] = []
+    for pair in pairs:
+        raw = None
+        if pair is not None:
+            try:
+                raw = fetch_cached(DETAIL_URL.format(codc=pair[0], code=pair[1]))
+            except Exception as exc:
+                log.debug("  Skip %s/%s — %s", pair[1], pair[0], exc)
+        raws.append(raw)
+    details = STORE.memo_parse_many(
+        raws, "dges_parse", PARSER_VERSION, parse_detail, workers=WORKERS
     )
-    if m:
-        detail["distrito"] = m.group(1).strip().title()
-
-    # ── Tipo from características (HTML is ground truth for private schools) ──
-    caract = _sec_text(sections, "Caracter")
-    detail["tipo"] = "privada" if "Privado" in caract else "publica"
-
-    # ── Provas de ingresso ────────────────────────────────────────────────────
-    provas_nodes = _sec_nodes(sections, "Provas de Ingresso")
-    provas: list[dict] = []
-    if provas_nodes:
-        frag = BeautifulSoup("".join(str(n) for n in provas_nodes), "lxml")
-        for br in frag.find_all("br"):
-            br.replace_with("\n")
-        conjunto_id = 1
-        for line in frag.get_text().splitlines():
-            clean = line.replace("\xa0", " ").strip()
-            if not clean or clean.lower().startswith("um dos"):
-                continue
-            if re.fullmatch(r"ou", clean, re.IGNORECASE):
-                conjunto_id += 1
-                continue
-            m2 = re.match(r"^(\d{2})\s+(.+)$", clean)
-            if m2:
-                provas.append({
-                    "conjunto_id": conjunto_id,
-                    "code":        m2.group(1),
-                    "name":        m2.group(2).strip(),
-                })
-    detail["provas"] = provas
-
-    # ── Classificações mínimas ────────────────────────────────────────────────
-    cmin = _sec_text(sections, "Classif")
-    m = re.search(r"candidatura:\s*(\d+(?:[.,]\d)?)\s*pontos?", cmin)
-    if m:
-        detail["nota_minima_candidatura"] = float(m.group(1).replace(",", "."))
-    m = re.search(r"[Pp]rovas? de ingresso:\s*(\d+(?:[.,]\d)?)\s*pontos?", cmin)
-    if m:
-        detail["nota_minima_prova"] = float(m.group(1).replace(",", "."))
-
-    # ── Fórmula ───────────────────────────────────────────────────────────────
-    formula = _sec_text(sections, "rmula")
-    m = re.search(r"secund[aá]rio:\s*(\d+)\s*%", formula)
-    if m:
-        detail["peso_secundario"] = int(m.group(1)) / 100
-    m = re.search(r"[Pp]rovas? de ingresso:\s*(\d+)\s*%", formula)
-    if m:
-        detail["peso_exame"] = int(m.group(1)) / 100
-
-    # ── Historical grades (0-200 on page) ────────────────────────────────────
-    stats_nodes = _sec_nodes(sections, "Dados Estat")
-    if stats_nodes:
-        stats_soup = BeautifulSoup("".join(str(n) for n in stats_nodes), "lxml")
-        table = stats_soup.find("table")
-        if table:
-            trows = table.find_all("tr")
-            if len(trows) >= 3:
-                year_cells = [
-                    td.get_text(strip=True)
-                    for td in trows[0].find_all(["td", "th"])
-                ]
-                col_map: dict[int, tuple[int, int]] = {}
-                col_idx = 1
-                for yc in year_cells[1:]:
-                    if re.match(r"\d{4}", yc):
-                        yr = int(yc)
-                        for fase in (1, 2):
-                            col_map[col_idx] = (yr, fase)
-                            col_idx += 1
-                for data_row in trows[2:]:
-                    cells = [
-                        td.get_text(strip=True)
-                        for td in data_row.find_all(["td", "th"])
-                    ]
-                    if not cells:
-                        continue
-                    if "ltimo Colocado" in cells[0] or "ltimo colocado" in cells[0]:
-                        for ci, (yr, fase) in col_map.items():
-                            if ci < len(cells) and cells[ci]:
-                                v = _to_float(cells[ci])
-                                if v is not None:
-                                    detail[f"nota_{yr}_f{fase}"] = v  # 0-200 scale
-                        break
-
-    return detail
+    return [d or {} for d in details]
 
 # ── Build output rows ─────────────────────────────────────────────────────────
 
 def build_rows(
-    pares: list[dict],
+    pares: list[tuple],
     notas_2025: dict,
     notas_2024: dict,
 ) -> tuple[list[dict], list[dict], list[dict]]:
@@ -344,28 +436,38 @@ def build_rows(
     provas_rows: list[dict]  = []
     hist_rows: list[dict]    = []
 
+    # Scrape (uses cache if available, fetches otherwise), then parse in bulk
+    details = scrape_details([
+        (_s(r.cod_curso), _s(r.cod_uo))
+        if _s(r.curso) and _s(r.cod_uo) and _s(r.cod_curso)
+        else None
+        for r in pares
+    ])
+    fallback = sum(1 for d in details if d.get("_parser") == "tree")
+    if fallback:
+        log.info("  Tree-parser fallback used for %d / %d pages.", fallback, len(details))
+
     for i, row in enumerate(pares):
         if i % 100 == 0:
             log.info("  %d / %d", i, len(pares))
 
-        nome      = _s(row.get("CURSO"))
-        inst_nome = _s(row.get("IES UO"))
-        cod_uo    = _s(row.get("COD UO"))
-        cod_ies   = _s(row.get("COD IES"))
-        cod_curso = _s(row.get("COD CURSO"))
+        nome      = _s(row.curso)
+        inst_nome = _s(row.ies_uo)
+        cod_uo    = _s(row.cod_uo)
+        cod_ies   = _s(row.cod_ies)
+        cod_curso = _s(row.cod_curso)
         if not nome or not cod_uo or not cod_curso:
             continue
 
-        # Scrape (uses cache if available, fetches otherwise)
-        detail = scrape_detail(cod_curso, cod_uo)
+        detail = details[i]
 
-        subsistema = _s(row.get("SUBSISTEMA"))
+        subsistema = _s(row.subsistema)
         tipo = detail.get("tipo") or ("privada" if subsistema.lower() == "privado" else "publica")
 
-        cnaef_code = _s(row.get("COD CNAEF"))
+        cnaef_code = _s(row.cod_cnaef)
         area_app   = cnaef_to_area(cnaef_code)
 
-        vagas_2026 = _i(row.get("REGIME GERAL DE ACESSO"))
+        vagas_2026 = _i(row.vagas)
 
         nota_2025_xl = notas_2025.get((cod_uo, cod_curso))
         nota_2024_xl = notas_2024.get((cod_uo, cod_curso))
@@ -394,7 +496,7 @@ def build_rows(
             "Cód. Curso":            cod_curso,
             "Instituição":           inst_nome,
             "Curso":                 nome,
-            "Grau":                  _s(row.get("TIPO CURSO")),
+            "Grau":                  _s(row.tipo_curso),
             "Tipo":                  tipo,
             "Área App":              area_app,
             "Área CNAEF (código)":   cnaef_code,
@@ -416,7 +518,7 @@ def build_rows(
             "Nota Mín. Candidatura": detail.get("nota_minima_candidatura", ""),
             "Nota Mín. Prova":       detail.get("nota_minima_prova", ""),
             "Peso Secundário":       detail.get("peso_secundario", ""),
-            "Peso Exame":            detail.get("peso_exame", ""),
+            "Peso Exame":            detail.get("peso_exames", ""),
             # Provas
             "Provas de Ingresso":    provas_str,
             "N.º Conjuntos":         len(conj) if conj else "",
@@ -456,45 +558,131 @@ def build_rows(
 
 # ── Excel styling ─────────────────────────────────────────────────────────────
 
-def _style(ws):
-    hfill = PatternFill("solid", fgColor="1A3A4A")
-    afill = PatternFill("solid", fgColor="EDF4F7")
-    for cell in ws[1]:
-        cell.font      = Font(bold=True, color="FFFFFF", size=10)
-        cell.fill      = hfill
-        cell.alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
-    for i, row in enumerate(ws.iter_rows(min_row=2), 2):
-        fill = afill if i % 2 == 0 else None
-        for cell in row:
-            cell.alignment = Alignment(horizontal="left", vertical="center")
-            if fill:
-                cell.fill = fill
-    for col in ws.columns:
-        w = max((len(str(c.value or "")) for c in col), default=8)
-        ws.column_dimensions[col[0].column_letter].width = min(w + 2, 55)
-    ws.freeze_panes = "A2"
-    ws.row_dimensions[1].height = 28
+HEADER_FONT  = Font(bold=True, color="FFFFFF", size=10)
+HEADER_FILL  = PatternFill("solid", fgColor="1A3A4A")
+HEADER_ALIGN = Alignment(horizontal="center", vertical="center", wrap_text=True)
+BAND_FILL    = PatternFill("solid", fgColor="EDF4F7")
+CELL_ALIGN   = Alignment(horizontal="left", vertical="center")
+
+def _columns(rows: list[dict]) -> list[str]:
+    """Union of the rows' keys in first-seen order (what pd.DataFrame(rows) gives)."""
+    cols: dict[str, None] = {}
+    for r in rows:
+        for k in r:
+            cols.setdefault(k)
+    return list(cols)
+
+def _write_xlsx(path: Path, sheets: list[tuple[str, str, list[dict]]]) -> None:
+    """
+    Write-only workbook: rows are styled as they are appended (header, banded
+    fill, alignment) and column widths come from one pass over the values, so
+    no sheet is ever held as a tree of cells and nothing is walked twice.
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+
+    wb = Workbook(write_only=True)
+    for title, _slug, rows in sheets:
+        ws   = wb.create_sheet(title)
+        cols = _columns(rows)
+
+        # Widths must be known before the first row is written
+        widths = [len(c) for c in cols]
+        for r in rows:
+            for j, c in enumerate(cols):
+                v = r.get(c)
+                if v is not None:
+                    widths[j] = max(widths[j], len(str(v)))
+        for j, w in enumerate(widths, 1):
+            ws.column_dimensions[get_column_letter(j)].width = min(w + 2, 55)
+        ws.freeze_panes = "A2"
+        ws.row_dimensions[1].height = 28
+
+        header = []
+        for c in cols:
+            cell = WriteOnlyCell(ws, value=c)
+            cell.font, cell.fill, cell.alignment = HEADER_FONT, HEADER_FILL, HEADER_ALIGN
+            header.append(cell)
+        ws.append(header)
+
+        for i, r in enumerate(rows, 2):
+            out = []
+            for c in cols:
+                cell = WriteOnlyCell(ws, value=r.get(c))
+                cell.alignment = CELL_ALIGN
+                if i % 2 == 0:
+                    cell.fill = BAND_FILL
+                out.append(cell)
+            ws.append(out)
+    wb.save(str(path))
+
+def _write_csv(path: Path, sheets: list[tuple[str, str, list[dict]]]) -> list[Path]:
+    written = []
+    for _title, slug, rows in sheets:
+        out = path.with_name(f"{path.stem}.{slug}.csv")
+        with open(out, "w", encoding="utf-8", newline="") as f:
+            w = csv.DictWriter(f, fieldnames=_columns(rows))
+            w.writeheader()
+            w.writerows(rows)
+        written.append(out)
+    return written
+
+def _write_parquet(path: Path, sheets: list[tuple[str, str, list[dict]]]) -> list[Path]:
+    import pandas as pd
+
+    written = []
+    for _title, slug, rows in sheets:
+        out = path.with_name(f"{path.stem}.{slug}.parquet")
+        # "" marks a missing value in the rows; typed columns need a real null
+        clean = [{k: (None if v == "" else v) for k, v in r.items()} for r in rows]
+        pd.DataFrame(clean, columns=_columns(rows)).to_parquet(out, index=False)
+        written.append(out)
+    return written
 
 # ── Main ──────────────────────────────────────────────────────────────────────
 
 def main():
+    global STORE
+    if STORE is None:
+        STORE = PageStore(CACHE_DIR / "pages.sqlite")
+
     log.info("=== Step 1: Loading Excel sources ===")
-    pares      = load_pares()
-    notas_2025 = load_notas_2025()
-    notas_2024 = load_notas_2024()
+    # The three workbooks load in parallel processes (openpyxl is CPU-bound);
+    # the notas keep loading while the detail pages are fetched.
+    with ProcessPoolExecutor(max_workers=3) as pool:
+        f_pares = pool.submit(load_pares)
+        f_2025  = pool.submit(load_notas_2025)
+        f_2024  = pool.submit(load_notas_2024)
+        pares   = f_pares.result()
+
+        log.info("=== Step 2: Scraping %d detail pages (uses cache when available) ===", len(pares))
+        prefetch([
+            DETAIL_URL.format(codc=_s(r.cod_curso), code=_s(r.cod_uo))
+            for r in pares
+            if _s(r.curso) and _s(r.cod_uo) and _s(r.cod_curso)
+        ])
+        notas_2025 = f_2025.result()
+        notas_2024 = f_2024.result()
 
-    log.info("=== Step 2: Scraping %d detail pages (uses cache when available) ===", len(pares))
     main_rows, provas_rows, hist_rows = build_rows(pares, notas_2025, notas_2024)
+    log.info("  Parse memo: %d reused, %d parsed.", STORE.parse_hits, STORE.parse_misses)
+    RETRY.save()
 
-    log.info("=== Step 3: Writing Excel ===")
-    import pandas as pd
-    with pd.ExcelWriter(str(OUTPUT), engine="openpyxl") as w:
-        pd.DataFrame(main_rows).to_excel(w,   index=False, sheet_name="Cursos")
-        pd.DataFrame(provas_rows).to_excel(w, index=False, sheet_name="Provas (detalhe)")
-        pd.DataFrame(hist_rows).to_excel(w,   index=False, sheet_name="Histórico")
-        _style(w.sheets["Cursos"])
-        _style(w.sheets["Provas (detalhe)"])
-        _style(w.sheets["Histórico"])
+    sheets = [
+        ("Cursos",           "cursos",    main_rows),
+        ("Provas (detalhe)", "provas",    provas_rows),
+        ("Histórico",        "historico", hist_rows),
+    ]
+    if FORMAT == "xlsx":
+        log.info("=== Step 3: Writing Excel ===")
+        _write_xlsx(OUTPUT, sheets)
+        written = [OUTPUT]
+    elif FORMAT == "csv":
+        log.info("=== Step 3: Writing CSV ===")
+        written = _write_csv(OUTPUT, sheets)
+    else:
+        log.info("=== Step 3: Writing Parquet ===")
+        written = _write_parquet(OUTPUT, sheets)
 
     # Quality report
     total       = len(main_rows)
@@ -514,7 +702,8 @@ def main():
     log.info("  Peso scraped:       %d / %d  (%.0f%%)", with_peso,   total, 100*with_peso/total)
     log.info("  Distrito scraped:   %d / %d  (%.0f%%)", with_dist,   total, 100*with_dist/total)
     log.info("  Histórico rows:     %d", len(hist_rows))
-    log.info("Saved → %s", OUTPUT)
+    for p in written:
+        log.info("Saved → %s", p)
     log.info("=== Done! ===")
 
 